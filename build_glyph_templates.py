@@ -0,0 +1,55 @@
+import os
+import pandas as pd
+
+from parse.ocr_utils import ocr_table, load_image, preprocess_image, extract_grid_cells
+from parse.glyph_templates import TEMPLATE_FORMATS, build_glyph_templates, save_glyph_templates
+
+
+INPUT_DIR = "./data/input_gifs"
+RESULTS_CSV = "./output/parsed_results.csv"
+TEMPLATES_PATH = "./data/glyph_templates.npz"
+
+def collect_samples(image_path, parsed_rows):
+    '''
+    Pair the numeric cells of a sheet with their already-parsed values.
+    Grid rows are matched to parsed rows by classification position (row order).
+    '''
+    table_image = preprocess_image(load_image(image_path), return_title=False)['table_img']
+    labels, _, row_cells = extract_grid_cells(table_image, ocr_table)
+
+    known = parsed_rows.drop_duplicates(subset='POS', keep=False).set_index('POS', drop=False)
+
+    samples = []
+    for r, cells in enumerate(row_cells):
+        if str(r + 1) not in known.index:
+            continue
+        row = known.loc[str(r + 1)]
+
+        for col_labels, cell in zip(labels, cells):
+            if cell is None or len(col_labels) != 1 or col_labels[0] not in TEMPLATE_FORMATS:
+                continue
+            value = row[col_labels[0]]
+            if pd.notna(value):
+                samples.append((col_labels[0], cell, value))
+
+    return samples
+
+if __name__ == "__main__":
+    # ON is read as float by pandas when it has gaps - read everything as text
+    df_results = pd.read_csv(RESULTS_CSV, dtype=str)
+    df_results['ON'] = df_results['ON'].str.replace(r'\.0$', '', regex=True)
+
+    samples = []
+    for i, (fname, parsed_rows) in enumerate(df_results.groupby('FILENAME'), 1):
+        path = os.path.join(INPUT_DIR, fname)
+        if not os.path.exists(path):
+            continue
+        print(f"[{i}] Collecting glyphs from {fname}")
+        samples.extend(collect_samples(path, parsed_rows))
+
+    templates = build_glyph_templates(samples)
+    save_glyph_templates(templates, TEMPLATES_PATH)
+
+    for label, chars in templates.items():
+        print(f"{label}: {''.join(sorted(chars))}")
+    print(f"✔ Saved glyph templates to {TEMPLATES_PATH}")
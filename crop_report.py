@@ -0,0 +1,50 @@
+import os
+import time
+import pandas as pd
+
+from parse.ocr_utils import ocr_table, ocr_standard, load_image, preprocess_image
+
+
+INPUT_DIR = "./data/input_gifs"
+REPORT_CSV = "./output/crop_report.csv"
+
+# Set to None to run over the whole archive - OCR is run twice per sheet
+SAMPLE_SIZE = 20
+
+def time_ocr(crops):
+    '''OCR each crop with the engine used for it in process_image_to_dataframe, returning seconds taken'''
+
+    start = time.perf_counter()
+    ocr_table.ocr(crops['table_img'])
+    ocr_standard.ocr(crops['date_img'])
+    ocr_standard.ocr(crops['title_img'])
+    return time.perf_counter() - start
+
+if __name__ == "__main__":
+    # Compare the fixed-fraction crops with the ink-projection crops from detect_layout
+    file_list = sorted(f for f in os.listdir(INPUT_DIR) if f.lower().endswith('.gif'))
+    if SAMPLE_SIZE is not None:
+        file_list = file_list[:SAMPLE_SIZE]
+
+    report = []
+
+    for i, fname in enumerate(file_list, 1):
+        print(f"[{i}] Timing {fname}")
+        img = load_image(os.path.join(INPUT_DIR, fname))
+
+        for mode, adaptive in [('fixed', False), ('adaptive', True)]:
+            crops = preprocess_image(img, adaptive=adaptive)
+            report.append({
+                'FILENAME': fname,
+                'MODE': mode,
+                'TABLE_PIXELS': crops['table_img'].shape[0] * crops['table_img'].shape[1],
+                'TOTAL_PIXELS': sum(crops[key].shape[0] * crops[key].shape[1] for key in ['table_img', 'date_img', 'title_img']),
+                'OCR_SECONDS': time_ocr(crops),
+            })
+
+    df_report = pd.DataFrame(report)
+    df_report.to_csv(REPORT_CSV, index=False)
+
+    summary = df_report.groupby('MODE')[['TABLE_PIXELS', 'TOTAL_PIXELS', 'OCR_SECONDS']].mean()
+    print(summary)
+    print(f"✔ Saved per-sheet report to {REPORT_CSV}")
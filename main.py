@@ -1,35 +1,196 @@
 import os
+import glob
+import hashlib
+import asyncio
+import argparse
 import pandas as pd
-from parse.parsing_logic import process_image_to_dataframe
-from parse.ocr_utils import ocr_table, ocr_standard  
+from functools import partial
+from parse.parsing_logic import load_sheet, ocr_sheet, parse_sheet
+from parse.async_ingest import ingest
+from parse.ocr_utils import ocr_table, ocr_standard, load_image
+from parse.glyph_templates import load_glyph_templates
+from parse.dedup import perceptual_hash, cluster_sheets, duplicate_report, fan_out_rows, fan_out_bad_rows
 
 
 INPUT_DIR = "./data/input_gifs"
 OUTPUT_CSV = "./output/parsed_results.csv"
 OCR_FAIL_LOG = "./output/ocr_failed_rows.csv"
+GLYPH_TEMPLATES = "./data/glyph_templates.npz" # Built by build_glyph_templates.py, used in GRID_MODE
+DUPLICATE_REPORT = "./output/duplicate_clusters.csv"
+
+# Per-shard outputs of `main.py --shard i/N`, combined by `main.py merge`
+SHARD_DIR = "./output/shards"
 
 SKIP_PREVIOUS_ERRORS = True
 
+# Segment the table into cells and run recognition only, skipping text detection
+GRID_MODE = False
+
+# OCR one sheet per cluster of near-identical sheets (perceptual hash), copying its rows to the others
+DEDUPLICATE = True
+
 BATCH_SIZE = 3
 
-if __name__ == "__main__":
-    # Load existing progress
-    if os.path.exists(OUTPUT_CSV):
-        df_master = pd.read_csv(OUTPUT_CSV)
-        processed = set(df_master['FILENAME'].unique())
-    else:
-        df_master = pd.DataFrame()
-        processed = set()
+# --async: OCR processes, and how many sheets may wait between stages
+OCR_WORKERS = 2
+QUEUE_SIZE = 4
+
+def shard_path(path, shard, num_shards):
+    '''Per-shard version of an output path, e.g. ./output/shards/parsed_results.shard-2-of-4.csv'''
+    base, ext = os.path.splitext(os.path.basename(path))
+    return os.path.join(SHARD_DIR, f"{base}.shard-{shard}-of-{num_shards}{ext}")
+
+def shard_of(fname, num_shards):
+    '''Shard (1..num_shards) of a file, from a hash of its name that is stable across machines and runs'''
+    digest = hashlib.sha1(fname.encode('utf-8')).hexdigest()
+    return int(digest, 16) % num_shards + 1
+
+def parse_shard(value):
+    '''argparse type for --shard i/N'''
+    try:
+        shard, num_shards = (int(part) for part in value.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected i/N, got '{value}'")
+    if not 1 <= shard <= num_shards:
+        raise argparse.ArgumentTypeError(f"shard must be between 1 and N, got '{value}'")
+    return shard, num_shards
 
-    if SKIP_PREVIOUS_ERRORS and os.path.exists(OCR_FAIL_LOG):
-        error_files = set(pd.read_csv(OCR_FAIL_LOG)['FILENAME'].unique())
+def csv_exists(path):
+    '''True if there is a CSV with a header at path - a shard with no rows leaves an empty file'''
+    return os.path.exists(path) and os.path.getsize(path) > 0
+
+def read_outputs(paths):
+    '''
+    Concatenate the existing CSVs at paths (empty DataFrame if none exist).
+    Read as text, so values written back (NO '07', ON with gaps) stay exactly as saved.
+    '''
+    frames = [
+        pd.read_csv(path, dtype=str, keep_default_na=False)
+        for path in paths if csv_exists(path)
+    ]
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+def plan_run(shard=None):
+    '''
+    Work out what a run has to do: the unprocessed GIFs in INPUT_DIR in file name order, where to save,
+    and which sheets are duplicates of another. With shard=(i, N), only the files of shard i are
+    selected, and results go to per-shard outputs.
+    '''
+    output_csv, fail_log = OUTPUT_CSV, OCR_FAIL_LOG
+    duplicate_report_csv = DUPLICATE_REPORT
+    if shard is not None:
+        os.makedirs(SHARD_DIR, exist_ok=True)
+        output_csv, fail_log = shard_path(OUTPUT_CSV, *shard), shard_path(OCR_FAIL_LOG, *shard)
+        duplicate_report_csv = shard_path(DUPLICATE_REPORT, *shard)
+
+    # Load existing progress - a shard also skips files already merged into the main outputs
+    df_done = read_outputs(sorted({OUTPUT_CSV, output_csv}))
+    processed = set(df_done['FILENAME'].unique()) if not df_done.empty else set()
+
+    df_errors = read_outputs(sorted({OCR_FAIL_LOG, fail_log}))
+    if SKIP_PREVIOUS_ERRORS:
+        error_files = set(df_errors['FILENAME'].unique()) if not df_errors.empty else set()
     else:
         error_files = set()
 
-    file_list = [f for f in os.listdir(INPUT_DIR) if f.lower().endswith('.gif')]
-    file_list = [f for f in file_list if f not in processed and (f not in error_files if SKIP_PREVIOUS_ERRORS else True)]
+    # Sorted, so runs are deterministic and `merge` can reproduce the single-node row order
+    all_files = sorted(f for f in os.listdir(INPUT_DIR) if f.lower().endswith('.gif'))
+    file_list = [f for f in all_files if f not in processed and (f not in error_files if SKIP_PREVIOUS_ERRORS else True)]
+
+    templates = load_glyph_templates(GLYPH_TEMPLATES) if GRID_MODE else None
+
+    representative = {} # fname -> sheet whose rows it reuses
+    sheet_results = {}  # representative -> (parsed rows, failed rows)
+    shard_key = {}      # fname -> name hashed for sharding (its cluster's first sheet, so clusters share a shard)
+
+    if DEDUPLICATE:
+        hashes = {f: perceptual_hash(load_image(os.path.join(INPUT_DIR, f))) for f in all_files}
+        clusters = cluster_sheets(hashes)
+
+        duplicate_report(clusters, hashes).to_csv(duplicate_report_csv, index=False)
+        print(f"Found {sum(len(c) > 1 for c in clusters)} clusters of duplicate sheets, see {duplicate_report_csv}\n")
+
+        pending = set(file_list)
+        for cluster in clusters:
+            for f in cluster:
+                shard_key[f] = cluster[0]
+
+            done = [f for f in cluster if f in processed]
+            todo = [f for f in cluster if f in pending]
+            if not todo:
+                continue
+
+            # Prefer a sheet parsed in a previous run, so the cluster needs no OCR at all.
+            # Otherwise the first in name order, which file_list reaches before the others
+            rep = done[0] if done else todo[0]
+            for f in todo:
+                representative[f] = rep
+            if done:
+                rep_errors = df_errors[df_errors['FILENAME'] == rep] if not df_errors.empty else df_errors
+                sheet_results[rep] = (df_done[df_done['FILENAME'] == rep], rep_errors.to_dict('records'))
+
+    if shard is not None:
+        file_list = [f for f in file_list if shard_of(shard_key.get(f, f), shard[1]) == shard[0]]
+        print(f"Shard {shard[0]}/{shard[1]}: ", end='')
+
     print(f"Found {len(file_list)} unprocessed GIFs.\n")
 
+    return {
+        'output_csv': output_csv,
+        'fail_log': fail_log,
+        'file_list': file_list,
+        'templates': templates,
+        'representative': representative,
+        'duplicates': {f for f, rep in representative.items() if f != rep},
+        'fan_out_sources': {rep for f, rep in representative.items() if f != rep},
+        'sheet_results': sheet_results,
+    }
+
+def save_batch(batch, bad_log, output_csv, fail_log):
+    '''Append parsed sheets to output_csv and their failed rows to fail_log'''
+    if batch:
+        combined = pd.concat(batch, ignore_index=True)
+        # Appending keeps memory flat however many sheets have been saved - match the existing column order
+        if csv_exists(output_csv):
+            combined = combined.reindex(columns=pd.read_csv(output_csv, nrows=0).columns)
+        combined.to_csv(output_csv, mode='a', index=False, header=not csv_exists(output_csv))
+        print(f"✔ Saved {len(batch)} entries to {output_csv}")
+
+    if bad_log:
+        error_df = pd.DataFrame(bad_log)
+        # Rewrite rather than append - older logs have no ROW_Y0/ROW_Y1 columns
+        if csv_exists(fail_log):
+            error_df = pd.concat([read_outputs([fail_log]), error_df], ignore_index=True)
+        error_df.to_csv(fail_log, index=False)
+
+def parse_or_fan_out(fname, sheet_ocr, plan):
+    '''
+    Parse a sheet's OCR output, or for a duplicate sheet copy the rows of its cluster's representative -
+    failed rows included, so retry_failed_rows.py recovers them for the duplicate too
+    '''
+    path = os.path.join(INPUT_DIR, fname)
+
+    if fname in plan['duplicates']:
+        rep = plan['representative'][fname]
+        print(f"    Duplicate of {rep}, copying its rows")
+        df, bad_rows = plan['sheet_results'][rep]
+        return fan_out_rows(df, path), fan_out_bad_rows(bad_rows, path)
+
+    df, bad_rows = parse_sheet(path, sheet_ocr)
+    if fname in plan['fan_out_sources']:
+        plan['sheet_results'][fname] = (df, bad_rows)
+    return df, bad_rows
+
+def finish_shard(plan, shard):
+    '''Leave a results file for a shard even if it saved no rows, so `merge` can tell it has run'''
+    if shard is not None and not os.path.exists(plan['output_csv']):
+        open(plan['output_csv'], 'w').close()
+
+def run(shard=None):
+    '''OCR and parse every unprocessed GIF in INPUT_DIR one at a time, in file name order (see plan_run)'''
+    plan = plan_run(shard)
+    file_list = plan['file_list']
+
     batch = []
     bad_log = []
 
@@ -38,11 +199,12 @@ if __name__ == "__main__":
         print(f"[{i}] Processing {fname}")
 
         try:
-            df, bad_rows = process_image_to_dataframe(
-                image_path=path
-            )
+            sheet_ocr = None
+            if fname not in plan['duplicates']:
+                sheet_ocr = ocr_sheet(load_sheet(path), grid=GRID_MODE, templates=plan['templates'])
+            df, bad_rows = parse_or_fan_out(fname, sheet_ocr, plan)
             batch.append(df)
-            bad_log.extend(bad_rows) 
+            bad_log.extend(bad_rows)
 
         except Exception as e:
             print(f"⚠️ Failed to process {fname}: {e}")
@@ -50,15 +212,145 @@ if __name__ == "__main__":
 
         # Save after every BATCH_SIZE files
         if i % BATCH_SIZE == 0 or i == len(file_list):
-            if batch:
-                combined = pd.concat(batch, ignore_index=True)
-                df_master = pd.concat([df_master, combined], ignore_index=True)
-                df_master.to_csv(OUTPUT_CSV, index=False)
-                print(f"✔ Saved {len(batch)} entries to {OUTPUT_CSV}")
-                batch = []
-
-            if bad_log:
-                error_df = pd.DataFrame(bad_log)
-                error_df.to_csv("output/ocr_failed_rows.csv", mode='a', index=False, header=not os.path.exists(OCR_FAIL_LOG))
-                bad_log = []  # ✅ reset for next batch
-                
\ No newline at end of file
+            save_batch(batch, bad_log, plan['output_csv'], plan['fail_log'])
+            batch = []
+            bad_log = []  # ✅ reset for next batch
+
+    finish_shard(plan, shard)
+
+def run_async(shard=None):
+    '''
+    Same as run, but loading, OCR and saving overlap: GIFs are loaded and results saved in threads,
+    OCR runs in OCR_WORKERS processes, and parsing runs in the event loop (see parse.async_ingest).
+    '''
+    plan = plan_run(shard)
+    file_list = plan['file_list']
+
+    batch = []
+    bad_log = []
+    handled = 0
+
+    async def handle(path, sheet_ocr):
+        nonlocal batch, bad_log, handled
+        fname = os.path.basename(path)
+        handled += 1
+        print(f"[{handled}] Processed {fname}")
+
+        try:
+            if isinstance(sheet_ocr, Exception):
+                raise sheet_ocr
+            df, bad_rows = parse_or_fan_out(fname, sheet_ocr, plan)
+            batch.append(df)
+            bad_log.extend(bad_rows)
+
+        except Exception as e:
+            print(f"⚠️ Failed to process {fname}: {e}")
+
+        # Save after every BATCH_SIZE files, in a thread so loading and OCR carry on meanwhile
+        if handled % BATCH_SIZE == 0 or handled == len(file_list):
+            to_save, to_log = batch, bad_log
+            batch, bad_log = [], []
+            await asyncio.to_thread(save_batch, to_save, to_log, plan['output_csv'], plan['fail_log'])
+
+    asyncio.run(ingest(
+        paths=[os.path.join(INPUT_DIR, fname) for fname in file_list],
+        load_fn=load_sheet,
+        ocr_fn=partial(ocr_sheet, grid=GRID_MODE, templates=plan['templates']),
+        handle_fn=handle,
+        skip_fn=lambda path: os.path.basename(path) in plan['duplicates'],
+        ocr_workers=OCR_WORKERS,
+        queue_size=QUEUE_SIZE
+    ))
+
+    finish_shard(plan, shard)
+
+def merge_shard_outputs(main_path, shard_paths, rewrite=False):
+    '''
+    Append the rows of every shard output to the CSV at main_path, skipping files already in it.
+    New rows are ordered by file name, keeping each file's own row order - the order a
+    single-node run processes (and appends) them in.
+
+    Rows are appended in the existing column order, as save_batch does. With rewrite, the file is
+    rewritten with all columns instead (error logs, where older logs lack the ROW_Y0/ROW_Y1 columns).
+    '''
+    df_main = read_outputs([main_path])
+
+    # A file is taken from the first shard output that has it, should two shards have processed it
+    seen = set()
+    shard_frames = []
+    for path in shard_paths:
+        df = read_outputs([path])
+        if df.empty:
+            continue
+        shard_frames.append(df[~df['FILENAME'].isin(seen)])
+        seen |= set(df['FILENAME'])
+
+    if not shard_frames:
+        return 0
+    df_shards = pd.concat(shard_frames, ignore_index=True)
+
+    if not df_main.empty:
+        df_shards = df_shards[~df_shards['FILENAME'].isin(set(df_main['FILENAME']))]
+    if df_shards.empty:
+        return 0
+
+    df_shards = df_shards.sort_values('FILENAME', kind='stable')
+
+    if rewrite:
+        pd.concat([df_main, df_shards], ignore_index=True).to_csv(main_path, index=False)
+    else:
+        if csv_exists(main_path):
+            df_shards = df_shards.reindex(columns=pd.read_csv(main_path, nrows=0).columns)
+        df_shards.to_csv(main_path, mode='a', index=False, header=not csv_exists(main_path))
+
+    return df_shards['FILENAME'].nunique()
+
+def merge():
+    '''
+    Combine per-shard results and error logs in SHARD_DIR into OUTPUT_CSV and OCR_FAIL_LOG.
+    Refuses to merge unless SHARD_DIR holds the results of every shard of a single shard count -
+    shards of different counts overlap, so their rows would be merged twice.
+    '''
+    shard_paths = {}
+    shards = set()
+    for main_path in [OUTPUT_CSV, OCR_FAIL_LOG]:
+        base, ext = os.path.splitext(os.path.basename(main_path))
+        shard_paths[main_path] = sorted(glob.glob(os.path.join(SHARD_DIR, f"{base}.shard-*-of-*{ext}")))
+        shards |= {
+            (main_path, *map(int, path[:-len(ext)].rsplit('.shard-', 1)[1].split('-of-')))
+            for path in shard_paths[main_path]
+        }
+
+    counts = {num_shards for _, _, num_shards in shards}
+    if len(counts) > 1:
+        print(f"⚠️ Not merging: {SHARD_DIR} has outputs from different shard counts {sorted(counts)}, remove the stale ones")
+        return
+
+    # Error logs only exist for shards with failures, so only check the results are complete
+    if counts:
+        num_shards = counts.pop()
+        missing = set(range(1, num_shards + 1)) - {i for path, i, _ in shards if path == OUTPUT_CSV}
+        if missing:
+            print(f"⚠️ Not merging: no results for shards {sorted(missing)} of {num_shards}, run them first")
+            return
+
+    for main_path in [OUTPUT_CSV, OCR_FAIL_LOG]:
+        num_files = merge_shard_outputs(main_path, shard_paths[main_path], rewrite=main_path == OCR_FAIL_LOG)
+        print(f"✔ Merged {num_files} files from {len(shard_paths[main_path])} shard outputs into {main_path}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="OCR and parse testing timing sheet GIFs")
+    parser.add_argument('command', nargs='?', choices=['run', 'merge'], default='run',
+                        help="run: process unprocessed GIFs (default). merge: combine shard outputs")
+    parser.add_argument('--shard', type=parse_shard, metavar='i/N',
+                        help="process only shard i of N (1-based), writing to per-shard outputs in " + SHARD_DIR)
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help="overlap loading, OCR and saving, with OCR in OCR_WORKERS processes")
+    args = parser.parse_args()
+
+    if args.command == 'merge':
+        merge()
+    elif args.use_async:
+        run_async(shard=args.shard)
+    else:
+        run(shard=args.shard)
@@ -0,0 +1,90 @@
+import asyncio
+import multiprocessing
+
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+
+_DONE = None # End-of-stream marker, one per downstream consumer
+
+async def _load_stage(paths, load_fn, skip_fn, io_pool, out_queue, num_consumers):
+    '''Load each sheet in the thread pool. Blocks on the bounded queue while OCR is behind'''
+    loop = asyncio.get_running_loop()
+
+    for idx, path in enumerate(paths):
+        payload = None
+        if not skip_fn(path):
+            try:
+                payload = await loop.run_in_executor(io_pool, load_fn, path)
+            except Exception as e:
+                payload = e
+        await out_queue.put((idx, path, payload))
+
+    for _ in range(num_consumers):
+        await out_queue.put(_DONE)
+
+async def _ocr_stage(ocr_fn, ocr_pool, in_queue, out_queue):
+    '''OCR loaded sheets in the process pool, passing skipped and failed sheets straight through'''
+    loop = asyncio.get_running_loop()
+
+    while (item := await in_queue.get()) is not _DONE:
+        idx, path, payload = item
+        if payload is not None and not isinstance(payload, Exception):
+            try:
+                payload = await loop.run_in_executor(ocr_pool, ocr_fn, payload)
+            except Exception as e:
+                payload = e
+        await out_queue.put((idx, path, payload))
+
+    await out_queue.put(_DONE)
+
+async def _handle_stage(handle_fn, in_queue, num_producers):
+    '''
+    Hand OCR results to handle_fn in input order. OCR workers finish out of order, so results
+    wait here until every earlier sheet is handled - only OCR text is held, never decoded frames.
+    '''
+    waiting = {}
+    next_idx = 0
+    finished = 0
+
+    while finished < num_producers:
+        item = await in_queue.get()
+        if item is _DONE:
+            finished += 1
+            continue
+
+        waiting[item[0]] = item
+        while next_idx in waiting:
+            _, path, payload = waiting.pop(next_idx)
+            await handle_fn(path, payload)
+            next_idx += 1
+
+async def ingest(paths, load_fn, ocr_fn, handle_fn, skip_fn=lambda path: False,
+                 ocr_workers=2, io_workers=2, queue_size=4):
+    '''
+    Run sheets through load -> OCR -> handle stages concurrently, connected by bounded queues.
+
+    - load_fn(path) runs in a thread pool (GIF decoding and cropping)
+    - ocr_fn(loaded) runs in a process pool of ocr_workers, each loading its own OCR models.
+      It must be picklable (a module-level function, or functools.partial of one)
+    - handle_fn(path, result) is a coroutine run in the event loop, in input order.
+      result is the OCR output, None for paths where skip_fn(path) is true (not loaded or OCRed),
+      or the exception raised loading or OCRing the sheet. Parse here; offload writes to a thread.
+
+    A full queue blocks the stage feeding it, so at most about queue_size + ocr_workers
+    decoded sheets are in memory at once, however many paths there are.
+    '''
+
+    # spawn, as forking a process with OCR models already loaded is not safe
+    mp_context = multiprocessing.get_context('spawn')
+
+    with ThreadPoolExecutor(max_workers=io_workers) as io_pool, \
+         ProcessPoolExecutor(max_workers=ocr_workers, mp_context=mp_context) as ocr_pool:
+
+        loaded = asyncio.Queue(maxsize=queue_size)
+        ocred = asyncio.Queue(maxsize=queue_size)
+
+        await asyncio.gather(
+            _load_stage(paths, load_fn, skip_fn, io_pool, loaded, num_consumers=ocr_workers),
+            *[_ocr_stage(ocr_fn, ocr_pool, loaded, ocred) for _ in range(ocr_workers)],
+            _handle_stage(handle_fn, ocred, num_producers=ocr_workers),
+        )
@@ -15,4 +15,29 @@ CIRCUIT_ALIASES = {
     "spa": "spa-francorchamps",
     "monza": "monza",
     "nürburgring": "nurburgring",  
-}
\ No newline at end of file
+}
+
+# Columns read from the timing table, in sheet order
+TABLE_COLUMNS = ['POS', 'NO', 'NAME', 'NAT', 'ENTRY', 'TIME', 'LAPS', 'ON']
+
+# Header spellings seen on TSL sheets that differ from the column label
+HEADER_ALIASES = {
+    'PIC': 'PL',
+}
+
+# Column headers of text sources (F1 site, wiki tables), lower case without '.' or ':'
+TEXT_HEADER_ALIASES = {
+    'pos': 'POS', 'position': 'POS', 'p': 'POS',
+    'no': 'NO', 'number': 'NO', 'car no': 'NO', '#': 'NO',
+    'driver': 'NAME', 'name': 'NAME',
+    'nat': 'NAT', 'nationality': 'NAT',
+    'team': 'ENTRY', 'entrant': 'ENTRY', 'constructor': 'ENTRY', 'car': 'ENTRY',
+    'time': 'TIME', 'best time': 'TIME', 'lap time': 'TIME', 'best lap': 'TIME', 'fastest lap': 'TIME',
+    'laps': 'LAPS', 'laps completed': 'LAPS',
+    'on': 'ON', 'on lap': 'ON',
+}
+
+# Characters OCR mistakes for letters, corrected before looking a token up in a word list
+OCR_CONFUSIONS = {
+    '0': 'O', '1': 'I', '|': 'I', '!': 'I', '2': 'Z', '5': 'S', '6': 'G', '8': 'B',
+}
@@ -0,0 +1,119 @@
+import os
+import cv2
+
+import numpy as np
+import pandas as pd
+
+from parse.ocr_utils import detect_layout
+from parse.parse_utils import parse_filename
+
+
+# Width of almost every archived sheet - sheets are brought to it before hashing
+HASH_PAGE_WIDTH = 794
+
+def perceptual_hash(img, hash_size=16, highfreq_factor=4):
+    '''
+    DCT perceptual hash of the timing table of a sheet, as a flat boolean array of hash_size**2 bits.
+
+    Every sheet shares the same page layout, so hashing the whole page puts different sheets
+    only a few bits apart - the hash is taken over the table box from detect_layout instead.
+    detect_layout pads and filters in pixels, so the page is first resized to HASH_PAGE_WIDTH,
+    else a rescaled copy gets a shifted table box and a hash far from the original.
+    Rescaled (0.6x-1.5x) and JPEG re-encoded copies land within 20 bits, different sheets 30+ bits apart (of 256).
+    '''
+
+    scale = HASH_PAGE_WIDTH / img.shape[1]
+    if scale != 1:
+        interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR
+        img = cv2.resize(img, (HASH_PAGE_WIDTH, round(img.shape[0] * scale)), interpolation=interpolation)
+
+    table_box = detect_layout(img)['table']
+    if table_box is not None:
+        x0, y0, x1, y1 = table_box
+        img = img[y0:y1, x0:x1]
+
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    size = hash_size * highfreq_factor
+    small = cv2.resize(gray.astype(np.float32), (size, size), interpolation=cv2.INTER_AREA)
+
+    low_freq = cv2.dct(small)[:hash_size, :hash_size].flatten()
+    return low_freq > np.median(low_freq[1:]) # Skip the DC term
+
+def cluster_sheets(hashes, max_distance=24):
+    '''
+    Group sheets whose hashes are within max_distance bits of each other (single linkage).
+    The default sits between the furthest copy (20 bits) and the nearest different sheets (30 bits).
+    hashes is a dictionary {filename: hash}.
+
+    Returns a list of clusters, each a sorted list of filenames, the first being the representative.
+    '''
+
+    names = sorted(hashes)
+    if not names:
+        return []
+
+    bits = np.array([hashes[name] for name in names])
+    distances = (bits[:, None, :] != bits[None, :, :]).sum(axis=2)
+
+    # Union-find over all pairs within max_distance
+    parent = list(range(len(names)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, j in zip(*np.nonzero(np.triu(distances <= max_distance, k=1))):
+        parent[find(i)] = find(j)
+
+    clusters = {}
+    for i, name in enumerate(names):
+        clusters.setdefault(find(i), []).append(name)
+
+    return sorted(clusters.values())
+
+def duplicate_report(clusters, hashes):
+    '''
+    One row per sheet in each cluster with more than one sheet, for reviewing duplicates:
+    a sheet filed under two different year-session-day names means one name is wrong.
+    '''
+    rows = []
+    for cluster_id, cluster in enumerate(c for c in clusters if len(c) > 1):
+        representative = cluster[0]
+        for fname in cluster:
+            year, session, day = parse_filename(fname)
+            rows.append({
+                'CLUSTER': cluster_id,
+                'FILENAME': fname,
+                'REPRESENTATIVE': representative,
+                'DISTANCE': int((hashes[fname] != hashes[representative]).sum()),
+                'YEAR': year,
+                'SESSION': session,
+                'DAY': day,
+            })
+
+    return pd.DataFrame(rows, columns=['CLUSTER', 'FILENAME', 'REPRESENTATIVE', 'DISTANCE', 'YEAR', 'SESSION', 'DAY'])
+
+def fan_out_rows(df, image_path):
+    '''
+    Copy the parsed rows of a cluster's representative for another sheet in the cluster,
+    replacing the file name metadata with that sheet's own.
+    '''
+    year, session, day = parse_filename(image_path)
+
+    df = df.copy()
+    df['YEAR'] = year
+    df['SESSION'] = session
+    df['DAY'] = day
+    df['FILENAME'] = os.path.basename(image_path)
+
+    return df
+
+def fan_out_bad_rows(bad_rows, image_path):
+    '''
+    Copy the failed rows of a cluster's representative for another sheet in the cluster.
+    ROW_Y0/ROW_Y1 still locate the rows, the image being the same.
+    '''
+    filename = os.path.basename(image_path)
+    return [{**row, 'FILENAME': filename} for row in bad_rows]
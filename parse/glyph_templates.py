@@ -0,0 +1,145 @@
+import os
+import re
+import cv2
+
+import numpy as np
+
+
+# Columns read by template matching, and the text each must match to be accepted
+TEMPLATE_FORMATS = {
+    'POS': r'\d{1,2}',
+    'TIME': r'\d:\d{2}\.\d{3}',
+    'LAPS': r'\d{1,3}',
+    'ON': r'\d{1,3}',
+}
+
+GLYPH_HEIGHT = 24
+GLYPH_WIDTH = 20
+
+def segment_glyphs(cell_img, ink_threshold=160, min_area=2):
+    '''
+    Split a single-line cell image into glyph images, left to right.
+
+    Glyphs are connected components of ink, merging components that overlap horizontally
+    (the two dots of a colon). Each glyph is cut at the full ink height of the cell,
+    scaled to GLYPH_HEIGHT and centred on a GLYPH_HEIGHT x GLYPH_WIDTH canvas, so
+    position within the line (e.g. '.' vs ':') is kept.
+
+    Returns a list of float32 arrays, or an empty list if the cell has no ink.
+    '''
+
+    gray = cv2.cvtColor(cell_img, cv2.COLOR_BGR2GRAY) if cell_img.ndim == 3 else cell_img
+    ink = (gray < ink_threshold).astype(np.uint8)
+
+    n, _, stats, _ = cv2.connectedComponentsWithStats(ink, connectivity=8)
+    spans = sorted(
+        [stats[i, cv2.CC_STAT_LEFT], stats[i, cv2.CC_STAT_LEFT] + stats[i, cv2.CC_STAT_WIDTH]]
+        for i in range(1, n) if stats[i, cv2.CC_STAT_AREA] >= min_area
+    )
+    if not spans:
+        return []
+
+    merged = [spans[0]]
+    for x0, x1 in spans[1:]:
+        if x0 < merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], x1)
+        else:
+            merged.append([x0, x1])
+
+    rows = np.flatnonzero(ink.any(axis=1))
+    line = 255 - gray[rows[0]:rows[-1] + 1].astype(np.float32) # Ink as high values
+    scale = GLYPH_HEIGHT / line.shape[0]
+
+    glyphs = []
+    for x0, x1 in merged:
+        width = min(max(int(round((x1 - x0) * scale)), 1), GLYPH_WIDTH)
+        glyph = cv2.resize(line[:, x0:x1], (width, GLYPH_HEIGHT), interpolation=cv2.INTER_AREA)
+        canvas = np.zeros((GLYPH_HEIGHT, GLYPH_WIDTH), dtype=np.float32)
+        left = (GLYPH_WIDTH - width) // 2
+        canvas[:, left:left + width] = glyph
+        glyphs.append(canvas)
+
+    return glyphs
+
+def build_glyph_templates(samples):
+    '''
+    Build per-column glyph templates from (label, cell_img, text) samples whose text is known,
+    e.g. cells of already-parsed sheets. Cells that don't segment into exactly one glyph
+    per character (touching glyphs, OCR errors in the text) are skipped.
+
+    Returns a dictionary {label: {char: template}}, each template the mean of its glyphs.
+    '''
+
+    glyph_sums = {}
+    for label, cell_img, text in samples:
+        text = str(text).replace(' ', '')
+        glyphs = segment_glyphs(cell_img)
+        if not text or len(glyphs) != len(text):
+            continue
+
+        for char, glyph in zip(text, glyphs):
+            total, count = glyph_sums.setdefault(label, {}).get(char, (0, 0))
+            glyph_sums[label][char] = (total + glyph, count + 1)
+
+    return {
+        label: {char: total / count for char, (total, count) in chars.items()}
+        for label, chars in glyph_sums.items()
+    }
+
+def save_glyph_templates(templates, path):
+    '''Save templates from build_glyph_templates to a .npz file'''
+    arrays = {f"{label}|{char}": template for label, chars in templates.items() for char, template in chars.items()}
+    np.savez_compressed(path, **arrays)
+
+def load_glyph_templates(path):
+    '''Load templates saved by save_glyph_templates, or None if there is no template file'''
+    if not os.path.exists(path):
+        return None
+
+    templates = {}
+    with np.load(path) as arrays:
+        for key in arrays.files:
+            label, char = key.split('|')
+            templates.setdefault(label, {})[char] = arrays[key]
+    return templates
+
+def match_glyph(glyph, char_templates):
+    '''
+    Score glyph against each template by normalized cross-correlation.
+    Returns (char, score, margin) for the best template, margin being its lead over the runner-up.
+    '''
+    scores = sorted(
+        ((float(cv2.matchTemplate(glyph, template, cv2.TM_CCOEFF_NORMED)[0, 0]), char) for char, template in char_templates.items()),
+        reverse=True
+    )
+    best_score, best_char = scores[0]
+    margin = best_score - scores[1][0] if len(scores) > 1 else best_score
+    return best_char, best_score, margin
+
+def read_numeric_cell(cell_img, label, templates, min_score=0.8, min_margin=0.03):
+    '''
+    Read a numeric cell (TIME, LAPS, ON or POS) by template matching.
+
+    Returns (text, confidence), confidence being the lowest glyph score.
+    Returns (None, 0.0) when the column has no templates, any glyph scores below min_score or
+    leads the next template by less than min_margin (e.g. 6/8/9 in the small LAPS font),
+    or the text doesn't match the column format - the cell should then go to the recognizer.
+    '''
+
+    char_templates = (templates or {}).get(label)
+    if not char_templates or label not in TEMPLATE_FORMATS:
+        return None, 0.0
+
+    glyphs = segment_glyphs(cell_img)
+    if not glyphs:
+        return None, 0.0
+
+    matches = [match_glyph(glyph, char_templates) for glyph in glyphs]
+    text = ''.join(char for char, _, _ in matches)
+    confidence = min(score for _, score, _ in matches)
+    margin = min(margin for _, _, margin in matches)
+
+    if confidence < min_score or margin < min_margin or not re.fullmatch(TEMPLATE_FORMATS[label], text):
+        return None, 0.0
+
+    return text, confidence
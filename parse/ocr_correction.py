@@ -0,0 +1,253 @@
+import re
+import os
+import unicodedata
+import pandas as pd
+
+from functools import lru_cache
+from rapidfuzz.distance import Levenshtein
+
+# ~~~~ Defined Constants ~~~~~ #
+from parse.constants import MONTHS, NATIONALITIES, OCR_CONFUSIONS
+
+# Known drivers, for correcting surnames - read relative to the working directory as in process_raw.py
+DRIVER_FILES = ["data/f1db/driver.csv", "data/f1db_updates/driver_updates.csv"]
+SEASON_DRIVER_FILES = ["data/f1db/season_entrant_driver.csv", "data/f1db_updates/season_entrant_driver_updates.csv"]
+
+_CONFUSION_TABLE = str.maketrans(OCR_CONFUSIONS)
+
+# ~~~~ Token normalisation ~~~~ #
+
+def _unconfuse(token):
+    '''Replace OCR look-alikes with the letter they stand for. A lower case 'l' in an otherwise upper case token is an 'I' '''
+    if 'l' in token and token.replace('l', '').isupper():
+        token = token.replace('l', 'I')
+    return token.translate(_CONFUSION_TABLE)
+
+def fold_token(token):
+    '''Upper case a token with OCR look-alikes replaced ('6BR' -> 'GBR', 'FlN' -> 'FIN') and spaces removed'''
+    return re.sub(r'\s+', '', _unconfuse(token).upper())
+
+def is_upper_token(token):
+    '''True if the token is printed in upper case, once look-alikes are replaced'''
+    return _unconfuse(token).isupper()
+
+def strip_accents(text):
+    return unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode()
+
+def _deletes(word, max_distance):
+    '''Every string made by deleting up to max_distance characters from word (including word)'''
+    found = {word}
+    frontier = {word}
+    for _ in range(max_distance):
+        frontier = {w[:i] + w[i+1:] for w in frontier for i in range(len(w))}
+        found |= frontier
+    return found
+
+# ~~~~ Correction index ~~~~ #
+
+class CorrectionIndex:
+    '''
+    Precomputed lookup correcting OCR tokens to a known word list.
+
+    Tokens are folded (see fold_token) and matched exactly, else matched within a bounded edit
+    distance through a deletion dictionary: every word is stored under all its deletes, so a
+    lookup only generates the deletes of the token - no scan over the word list.
+    Tokens under 3 characters are only matched exactly, and the distance allowed grows
+    with token length up to max_distance (1 per 3 characters).
+    '''
+
+    def __init__(self, words, max_distance=1):
+        self.max_distance = max_distance
+        self.exact = {}
+        self.deletes = {}
+
+        for word in words:
+            key = fold_token(word)
+            self.exact.setdefault(key, set()).add(word)
+            for variant in _deletes(key, self._limit(key)):
+                self.deletes.setdefault(variant, set()).add(key)
+
+    def _limit(self, key):
+        return min(self.max_distance, len(key) // 3)
+
+    def __contains__(self, token):
+        return fold_token(token) in self.exact
+
+    def _candidates(self, key):
+        '''(distance, word key) of the words within range of a folded token, closest first'''
+        limit = self._limit(key)
+        if limit == 0:
+            return []
+
+        candidates = set()
+        for variant in _deletes(key, limit):
+            candidates |= self.deletes.get(variant, set())
+
+        # Deletes only narrow the candidates - check the actual edit distance
+        scored = []
+        for candidate in candidates:
+            distance = Levenshtein.distance(key, candidate)
+            if distance > limit:
+                continue
+            # Two characters dropped from a longer token is more likely a different word ('DIRESTA' -> 'RESTA')
+            if distance >= 2 and distance == len(key) - len(candidate):
+                continue
+            scored.append((distance, candidate))
+
+        return sorted(scored)
+
+    def lookup(self, token):
+        '''
+        Return (word, distance) for the closest known word, distance 0 meaning an exact match
+        after folding OCR look-alikes. Returns (None, None) if nothing is in range, or if
+        two words are equally close.
+        '''
+        key = fold_token(token)
+
+        if key in self.exact:
+            words = self.exact[key]
+            return (next(iter(words)), 0) if len(words) == 1 else (None, None)
+
+        scored = self._candidates(key)
+        if not scored or (len(scored) > 1 and scored[0][0] == scored[1][0]):
+            return None, None
+
+        distance, candidate = scored[0]
+        words = self.exact[candidate]
+        return (next(iter(words)), distance) if len(words) == 1 else (None, None)
+
+    def is_near(self, token):
+        '''True if any known word is within range of the token, even where lookup finds a tie'''
+        key = fold_token(token)
+        return key in self.exact or bool(self._candidates(key))
+
+    def correct(self, token):
+        '''Return the known word for token, or None'''
+        return self.lookup(token)[0]
+
+NATIONALITY_INDEX = CorrectionIndex(NATIONALITIES, max_distance=1)
+MONTH_INDEX = CorrectionIndex(MONTHS, max_distance=2)
+
+# ~~~~ Driver surnames ~~~~ #
+
+def _read_csvs(paths, columns):
+    frames = [pd.read_csv(path, usecols=columns, encoding='utf-8-sig') for path in paths if os.path.exists(path)]
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=columns)
+
+@lru_cache(maxsize=None)
+def surname_index(year):
+    '''
+    CorrectionIndex over the surnames of drivers entered in F1DB for the year and the years
+    either side (test drivers often appear a season before or after their race entries).
+    Surnames are upper case without accents, as printed on the timing sheets ('HULKENBERG').
+    Empty if the F1DB files are not found.
+    '''
+    drivers = _read_csvs(DRIVER_FILES, ['id', 'last_name'])
+    seasons = _read_csvs(SEASON_DRIVER_FILES, ['year', 'driver_id'])
+
+    year = int(year)
+    driver_ids = set(seasons.loc[seasons['year'].between(year - 1, year + 1), 'driver_id'])
+    last_names = drivers.loc[drivers['id'].isin(driver_ids), 'last_name'].dropna()
+
+    tokens = set()
+    for last_name in last_names:
+        parts = [re.sub(r'[^A-Z]', '', part) for part in re.split(r'[\s-]+', strip_accents(last_name).upper())]
+        parts = [part for part in parts if part]
+
+        # Each word, and the words from each one to the end - matched with or without the
+        # spaces, as OCR often drops them ('DIRESTA' -> 'DI RESTA', 'LAROSA' -> 'LA ROSA')
+        tokens.update(parts)
+        tokens.update(' '.join(parts[i:]) for i in range(len(parts) - 1))
+
+    return CorrectionIndex(tokens, max_distance=2)
+
+def correct_surname_tokens(name_tokens, year):
+    '''
+    Correct the upper case (surname) tokens of a driver name against the year's known surnames,
+    leaving first names and tokens with no close surname as read.
+    A surname split in two ('BOTTA S', 'VAL SECCHI') is joined back where the join is a known
+    surname, and one run together is spaced as in F1DB ('DIRESTA' -> 'DI RESTA'). Tokens under 4 characters are only corrected by look-alikes - at one edit they are
+    as likely a fragment of another name ('VAL' -> 'VAN').
+    '''
+    if not year or not str(year).isdigit():
+        return name_tokens
+
+    surnames = surname_index(int(year))
+
+    corrected = []
+    i = 0
+    while i < len(name_tokens):
+        token = name_tokens[i]
+        if is_upper_token(token):
+            following = name_tokens[i + 1] if i + 1 < len(name_tokens) else ''
+            word, distance = surnames.lookup(token + following) if is_upper_token(following) else (None, None)
+            if distance == 0:
+                token = word
+                i += 1
+            else:
+                word, distance = surnames.lookup(token)
+                if word is not None and (distance == 0 or len(token) >= 4):
+                    token = word
+        corrected.append(token)
+        i += 1
+
+    return corrected
+
+# ~~~~ Nationality codes ~~~~ #
+
+def _nationality_token(token):
+    '''Strip surrounding punctuation, or None if the token cannot be a (mangled) code'''
+    token = token.strip('.,:;()[]')
+    if not re.fullmatch(r'[A-Za-z0-9|!]+', token) or not re.search(r'[A-Za-z]', token):
+        return None
+    return token
+
+def _fuzzy_code_allowed(token):
+    '''Edit distance matches only for 3 character upper case tokens, e.g. not at 'AT&T' or a first name'''
+    return len(token) == 3 and is_upper_token(token)
+
+def match_nationality(token):
+    '''
+    Return the nationality code a single OCR token (e.g. a NAT cell) stands for, or None.
+    Exact and look-alike matches ('6BR', 'FlN') are accepted, edit distance matches only
+    for 3 character upper case tokens.
+    '''
+    token = _nationality_token(token)
+    if token is None:
+        return None
+
+    nat, distance = NATIONALITY_INDEX.lookup(token)
+    if nat is None or distance == 0 or _fuzzy_code_allowed(token):
+        return nat
+    return None
+
+def find_nationality(tokens, surnames=None):
+    '''
+    Return (index, code) of the nationality code among the tokens of a row after the driver
+    number, or (None, None).
+
+    The first exact or look-alike match ('GER', '6BR', 'FlN') wins. Only if the row has none is an
+    edit distance match accepted ('NLO' -> 'NLD'), and then only for a 3 character upper case token
+    that follows the upper case surname and is not itself near a known surname - so surname
+    fragments ('BUM', 'HUA', 'VAN') and entrant words ('AMG') are not read as codes.
+    '''
+    fuzzy = []
+
+    for i, raw_token in enumerate(tokens):
+        token = _nationality_token(raw_token)
+        if token is None:
+            continue
+
+        nat, distance = NATIONALITY_INDEX.lookup(token)
+        if nat is None:
+            continue
+        if distance == 0:
+            return i, nat
+
+        if i == 0 or not _fuzzy_code_allowed(token) or not is_upper_token(tokens[i - 1]):
+            continue
+        if surnames is not None and surnames.is_near(token):
+            continue
+        fuzzy.append((i, nat))
+
+    return fuzzy[0] if fuzzy else (None, None)
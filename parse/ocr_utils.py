@@ -1,10 +1,14 @@
 import cv2
 import os
+import re
 
 import numpy as np
 
 from paddleocr import PaddleOCR
 
+from parse.constants import TABLE_COLUMNS, HEADER_ALIASES
+from parse.glyph_templates import read_numeric_cell
+
 
 ocr_standard = PaddleOCR(
     use_angle_cls=True,
@@ -20,6 +24,9 @@ ocr_table = PaddleOCR(
     draw_img_save_dir='./debug_output'
 )
 
+# Table crops are upscaled by this factor before OCR
+TABLE_UPSCALE = 2
+
 def run_ocr(image_path):
     # placeholder for your PaddleOCR wrapper
     pass
@@ -46,43 +53,329 @@ def load_image(path):
     
     return img
 
-def preprocess_image(img, return_title=True):
+def _ink_runs(profile, min_ink=1, max_gap=1, min_length=2):
+    '''
+    Given a 1D ink projection profile, return (start, end) index pairs (end exclusive)
+    of runs where the profile has ink, joining runs separated by <= max_gap empty entries.
+    '''
+    runs = []
+    for idx in np.flatnonzero(profile >= min_ink):
+        if runs and idx - runs[-1][1] <= max_gap:
+            runs[-1][1] = idx + 1
+        else:
+            runs.append([idx, idx + 1])
+
+    return [(start, end) for start, end in runs if end - start >= min_length]
+
+def _group_runs(runs, max_gap):
+    '''Group consecutive runs (text lines) into blocks where the gap between lines is <= max_gap'''
+    blocks = []
+    for run in runs:
+        if blocks and run[0] - blocks[-1][-1][1] <= max_gap:
+            blocks[-1].append(run)
+        else:
+            blocks.append([run])
+    return blocks
+
+def detect_layout(img, ink_threshold=160, block_gap=0.02, pad=4):
+    '''
+    Find the title line, the timing table and the date footer of a timing sheet
+    from row/column ink projection profiles of the grayscale frame.
+
+    Text lines are runs of rows containing ink; lines closer than block_gap*h are grouped into blocks.
+    - Title: the first text line on the sheet
+    - Table: the block with the most lines (header + one line per classified car)
+    - Date: the last text line in the right half of the sheet (the 'Printed - ...' line)
+
+    Returns a dictionary with keys ['title', 'table', 'date'], each an (x0, y0, x1, y1) box
+    (padded by pad pixels, clipped to the image), or None where that part was not found.
+    '''
+
+    h, w = img.shape[:2]
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    ink = gray < ink_threshold
+
+    def box(y0, y1, x_offset=0, x_limit=w):
+        cols = _ink_runs(ink[y0:y1, x_offset:x_limit].sum(axis=0), max_gap=w, min_length=1)
+        if not cols:
+            return None
+        x0, x1 = int(cols[0][0]) + x_offset, int(cols[-1][1]) + x_offset
+        return (max(x0 - pad, 0), max(int(y0) - pad, 0), min(x1 + pad, w), min(int(y1) + pad, h))
+
+    layout = {'title': None, 'table': None, 'date': None}
+
+    lines = _ink_runs(ink.sum(axis=1))
+    if not lines:
+        return layout
+
+    layout['title'] = box(*lines[0])
+
+    blocks = _group_runs(lines[1:], max_gap=int(block_gap * h))
+    if blocks:
+        table_block = max(blocks, key=len)
+        if len(table_block) >= 2: # Header row plus at least one result
+            layout['table'] = box(table_block[0][0], table_block[-1][1])
+
+    date_lines = _ink_runs(ink[:, w // 2:].sum(axis=1))
+    if date_lines and date_lines[-1][0] > h // 2:
+        layout['date'] = box(*date_lines[-1], x_offset=w // 2)
+
+    return layout
+
+def preprocess_image(img, return_title=True, adaptive=True):
     '''
     Given an img (array), preprocess the various parts of the timing sheet.
     The Title, which we will use to get the circuit name
     the Table, which contains the timing data
     the Footer, which contains the date metadata
 
+    With adaptive=True, the parts are cropped to the boxes found by detect_layout,
+    falling back to the fixed crop for any part that could not be detected.
+
     Preprocessing: crops, often upscales and sharpens
 
     Returns a dictionary, crops, with keys ['title_img', 'table_img', 'date_img']
-    containing img arrays of the respective areas.
+    containing img arrays of the respective areas, and 'table_box', the (x0, y0, x1, y1)
+    of the table in img (table_img is that area upscaled by TABLE_UPSCALE).
     '''
 
     h, w = img.shape[:2]
-    
-    # Top half: assumed to contain the timing table
-    table_crop = img[int(0.12*h):int(0.5*h), 0:w]
-    table_up = cv2.resize(table_crop, None, fx=2, fy=2, interpolation=cv2.INTER_LINEAR)
+
+    # Fixed crops, as (x0, y0, x1, y1)
+    boxes = {
+        'table': (0, int(0.12*h), w, int(0.5*h)),        # Top half: assumed to contain the timing table
+        'date': (int(0.7*w), int(0.963*h), w, h),         # Bottom-right corner: assumed to contain the date
+        'title': (0, 0, int(0.5*w), int(0.09*h)),         # Top header: circuit metadata
+    }
+
+    if adaptive:
+        detected = detect_layout(img)
+        boxes.update({key: box for key, box in detected.items() if box is not None})
+
+    def crop(key):
+        x0, y0, x1, y1 = boxes[key]
+        return img[y0:y1, x0:x1]
+
+    table_up = cv2.resize(crop('table'), None, fx=TABLE_UPSCALE, fy=TABLE_UPSCALE, interpolation=cv2.INTER_LINEAR)
     table_sharp = unsharp_mask(table_up)
-    
-    # Bottom-right corner: assumed to contain the date
-    date_crop = img[int(0.963*h):h, int(0.7*w):w]
-    date_up = cv2.resize(date_crop, None, fx=2, fy=2, interpolation=cv2.INTER_LINEAR)
+
+    date_up = cv2.resize(crop('date'), None, fx=2, fy=2, interpolation=cv2.INTER_LINEAR)
     date_sharp = unsharp_mask(date_up, kernel_size=(5,5), sigma=1.0, amount=1.2, threshold=0.0)
 
     crops = {
         'table_img': table_sharp,
         'date_img': date_sharp,
+        'table_box': boxes['table'],
     }
 
     # Optionally include top header for circuit metadata
     if return_title:
-        title_crop = img[0:int(0.09*h), 0:int(0.5*w)]
-        crops['title_img'] = title_crop
+        crops['title_img'] = crop('title')
 
     return crops
 
+def segment_table_grid(table_img, ink_threshold=160, col_gap=0.8, pad=3):
+    '''
+    Segment a (preprocessed) table crop into row strips and column cells using
+    horizontal and vertical ink projection profiles.
+
+    Rows are runs of inked rows, dropping runs much thinner than a text line (table rules).
+    Columns are runs of inked columns over the data rows, joining gaps narrower than
+    col_gap * line height - so words within a NAME or ENTRY stay in one cell.
+
+    Returns (header_row, data_rows, header_cols, data_cols) where rows are (y0, y1)
+    and cols are (x0, x1) spans in table_img coordinates.
+    '''
+
+    h, w = table_img.shape[:2]
+    gray = cv2.cvtColor(table_img, cv2.COLOR_BGR2GRAY) if table_img.ndim == 3 else table_img
+    ink = gray < ink_threshold
+
+    lines = _ink_runs(ink.sum(axis=1))
+    if len(lines) < 2:
+        return None, [], [], []
+
+    line_height = np.median([end - start for start, end in lines])
+    lines = [(start, end) for start, end in lines if end - start >= 0.4 * line_height]
+    if len(lines) < 2:
+        return None, [], [], []
+
+    def padded(start, end, limit):
+        return max(int(start) - pad, 0), min(int(end) + pad, limit)
+
+    def col_spans(y_ranges):
+        profile = sum(ink[y0:y1].sum(axis=0) for y0, y1 in y_ranges)
+        return [padded(*span, w) for span in _ink_runs(profile, max_gap=int(col_gap * line_height), min_length=1)]
+
+    header_row, data_rows = lines[0], lines[1:]
+    header_cols = col_spans([header_row])
+    data_cols = col_spans(data_rows)
+
+    return padded(*header_row, h), [padded(*row, h) for row in data_rows], header_cols, data_cols
+
+def recognize_cells(cells, ocr_engine):
+    '''
+    Run only the recognition model of ocr_engine over a list of cell images, in batches.
+    Returns a list of (text, confidence) pairs, one per cell.
+    '''
+    if not cells:
+        return []
+
+    rec_res, _ = ocr_engine.text_recognizer(cells)
+    return [(text, conf) for text, conf in rec_res]
+
+def _label_header(header_cols, header_texts):
+    '''
+    Map recognized header cells to (label, x0, x1) spans, splitting cells that hold several
+    labels (e.g. 'POS NO' read as one cell) in proportion to their character counts.
+    '''
+    spans = []
+    for (x0, x1), text in zip(header_cols, header_texts):
+        words = [re.sub(r'[^A-Z]', '', word.upper()) for word in text.split()]
+        words = [HEADER_ALIASES.get(word, word) for word in words if word]
+        if not words:
+            continue
+
+        total = sum(len(word) for word in words)
+        start = x0
+        for word in words:
+            end = start + (x1 - x0) * len(word) / total
+            spans.append((word, start, end))
+            start = end
+
+    return spans
+
+def _label_column(x0, x1, header_spans):
+    '''
+    Labels of the header spans overlapping (x0, x1), left to right, or the nearest one if none overlap.
+    Several labels means the column merged neighbouring columns (e.g. a two digit POS next to the NO).
+    '''
+    if not header_spans:
+        return []
+
+    labels = [label for label, h0, h1 in header_spans if min(x1, h1) - max(x0, h0) > 0]
+    if labels:
+        return labels
+
+    center = (x0 + x1) / 2
+    nearest = min(header_spans, key=lambda span: abs((span[1] + span[2]) / 2 - center))
+    return [nearest[0]]
+
+def _split_cell(text, labels):
+    '''
+    Split the text of a cell spanning several labels: one token for each label but the last,
+    which takes the remainder. Cells with too few tokens go to the last label.
+    '''
+    tokens = text.split()
+    if len(labels) == 1 or len(tokens) < len(labels):
+        return [(labels[-1], text)]
+
+    split = len(labels) - 1
+    return list(zip(labels[:split], tokens[:split])) + [(labels[-1], ' '.join(tokens[split:]))]
+
+def extract_grid_cells(table_img, ocr_engine):
+    '''
+    Segment a table crop with segment_table_grid and label its columns, recognizing only the header row.
+
+    Returns (labels, data_rows, row_cells):
+    - labels: for each data column, the list of header labels it spans (see _label_column)
+    - data_rows: (y0, y1) span of each data row in table_img
+    - row_cells: for each data row, the cell image of each column (None for empty cells)
+    '''
+
+    header_row, data_rows, header_cols, data_cols = segment_table_grid(table_img)
+    if header_row is None:
+        return [], [], []
+
+    gray = cv2.cvtColor(table_img, cv2.COLOR_BGR2GRAY) if table_img.ndim == 3 else table_img
+
+    def cell(y0, y1, x0, x1):
+        return table_img[y0:y1, x0:x1] if (gray[y0:y1, x0:x1] < 160).any() else None
+
+    header_cells = [cell(*header_row, x0, x1) for x0, x1 in header_cols]
+    header_read = iter(recognize_cells([c for c in header_cells if c is not None], ocr_engine))
+    header_texts = [next(header_read)[0] if c is not None else '' for c in header_cells]
+
+    header_spans = _label_header(header_cols, header_texts)
+    labels = [_label_column(x0, x1, header_spans) for x0, x1 in data_cols]
+
+    row_cells = [[cell(y0, y1, x0, x1) for x0, x1 in data_cols] for y0, y1 in data_rows]
+
+    return labels, data_rows, row_cells
+
+def ocr_table_grid(table_img, ocr_engine, templates=None):
+    '''
+    Recognition-only OCR of a table crop: segment it into a grid of labelled cells with
+    extract_grid_cells and recognize all non-empty cells in one batch (no text detection).
+
+    If glyph templates are given (see parse.glyph_templates), numeric cells (POS, TIME, LAPS, ON)
+    are read by template matching first, and only low-confidence ones go to the recognizer.
+
+    Returns a list of dicts, one per data row, with keys
+    ['cells' ({label: text} for labels in TABLE_COLUMNS), 'raw_row', 'box' ((y0, y1) in table_img)].
+    '''
+
+    labels, data_rows, row_cells = extract_grid_cells(table_img, ocr_engine)
+
+    # Collect every cell not read from templates, so the recognizer runs over the sheet in batches
+    texts, pending, index = {}, [], []
+    for r, cells in enumerate(row_cells):
+        for c, cell in enumerate(cells):
+            if cell is None:
+                continue
+            if templates and len(labels[c]) == 1:
+                text, _ = read_numeric_cell(cell, labels[c][0], templates)
+                if text is not None:
+                    texts[(r, c)] = text
+                    continue
+            pending.append(cell)
+            index.append((r, c))
+
+    texts.update({key: text for key, (text, _) in zip(index, recognize_cells(pending, ocr_engine))})
+
+    grid_rows = []
+    for r, box in enumerate(data_rows):
+        row_texts = [texts.get((r, c), '') for c in range(len(labels))]
+        cells_by_label = {label: '' for label in TABLE_COLUMNS}
+        for col_labels, text in zip(labels, row_texts):
+            if not text or not col_labels:
+                continue
+            for label, value in _split_cell(text, col_labels):
+                if label in cells_by_label:
+                    cells_by_label[label] = (cells_by_label[label] + ' ' + value).strip()
+
+        grid_rows.append({
+            'cells': cells_by_label,
+            'raw_row': ' '.join(text for text in row_texts if text),
+            'box': box,
+        })
+
+    return grid_rows
+
+def table_span_to_image(span, table_box):
+    '''Map a (y0, y1) row span in table_img coordinates to the full image the table was cropped from'''
+    y_top = table_box[1]
+    return y_top + int(span[0] // TABLE_UPSCALE), y_top + int(-(-span[1] // TABLE_UPSCALE))
+
+def crop_row_strips(img, table_box, spans, scale=3, pad=3, gap=12):
+    '''
+    Crop the given (y0, y1) row spans of the full img across the table width, stack them
+    top to bottom with gap white pixels between, then upscale by scale and sharpen.
+    Used to re-OCR single rows at a higher resolution than the whole table.
+    '''
+
+    h = img.shape[0]
+    x0, _, x1, _ = table_box
+
+    strips = []
+    for y0, y1 in spans:
+        strips.append(img[max(y0 - pad, 0):min(y1 + pad, h), x0:x1])
+        strips.append(np.full((gap, x1 - x0) + img.shape[2:], 255, dtype=img.dtype))
+
+    stacked = np.vstack(strips[:-1])
+    upscaled = cv2.resize(stacked, None, fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC)
+    return unsharp_mask(upscaled)
+
 def unsharp_mask(image, kernel_size=(5, 5), sigma=1.0, amount=1.0, threshold=0):
     """Return a sharpened version of the image, using an unsharp mask."""
 
@@ -0,0 +1,124 @@
+# Parsing helpers that need no OCR engine - importing this module does not load any models
+import re
+import os
+import pandas as pd
+
+# ~~~~ Defined Constants ~~~~~ #
+from parse.constants import MONTHS
+
+# ~~~~ OCR token correction ~~~~~ #
+from parse.ocr_correction import MONTH_INDEX, match_nationality, correct_surname_tokens
+
+# ~~~~ Metadata extraction ~~~~ #
+
+def parse_filename(fname):
+    '''Extract strings for year, session, and day, encoded in the file name in that order'''
+    base = os.path.splitext(os.path.basename(fname))[0]
+    parts = re.split(r"[_-]", base)
+    year, session, day = parts[0], parts[1] if len(parts)>1 else '', parts[2] if len(parts)>2 else ''
+    return year, session, day
+
+def extract_date(date_lines):
+    '''Return Date string e.g. '12 March 2014' from OCR text input
+    OCR error months are corrected with the precomputed month index'''
+
+    if not date_lines:
+        return None
+    
+    tokens = date_lines[0].strip().split()
+
+    if len(tokens) >= 4 and tokens[-3].isdigit(): # date line usually long, with date at end
+
+        if tokens[-2] not in MONTHS: # Slight OCR error - correct it, or no date if too far off
+            month = MONTH_INDEX.correct(tokens[-2])
+            return tokens[-3]+' '+month+' '+tokens[-1] if month else None
+        
+        else:
+            return " ".join(tokens[-3:])
+        
+    return None
+
+def extract_circuit(title_lines):
+    '''Extract Circuit string from title img ocr result text.
+    Circuit typically all caps and the only token that doesn't contain a digit
+    Also large text, OCR typically good here'''
+
+    if not title_lines:
+        return None
+    
+    parts = [p.strip() for p in title_lines[0].split('-')]
+
+    for part in parts:
+
+        if not re.search(r'\d', part): # Only the circuit should be digit free
+            return part[0].upper()+part[1:].lower()
+        
+    return None
+
+# ~~~~ Labelled Row Processing ~~~~ #
+
+def parse_grid_to_dataframe(grid_rows, year=None):
+    """
+    Convert labelled rows from ocr_table_grid into the same DataFrame as parse_ocr_to_dataframe.
+    Columns are already separated, so only per-cell cleanup and validation is needed.
+    """
+    parsed_rows = []
+    bad_rows = []
+
+    for display_order, row in enumerate(grid_rows, 1):
+        cells = row['cells']
+        joined = row['raw_row']
+
+        # Same non-data rows skipped as in parse_ocr_to_dataframe
+        if joined.strip().startswith('CAR') or not any(char.isdigit() for char in joined):
+            continue
+        if any(keyword in joined.upper() for keyword in ['PIRELLI', 'PREVIOUS', 'PENALTY']):
+            continue
+
+        try:
+            pos = re.sub(r'\D', '', cells['POS'])
+            no = re.sub(r'\D', '', cells['NO'])
+
+            # POS and NO read as one number - POS is the row's place in the classification
+            if not pos:
+                pos = str(display_order)
+                if no.startswith(pos) and len(no) > len(pos):
+                    no = no[len(pos):]
+
+            name = ' '.join(correct_surname_tokens(cells['NAME'].split(), year))
+            name = re.sub(r'[^\w\s]', '', name).title()
+            if not name:
+                raise ValueError("No driver name in row")
+
+            nat = match_nationality(cells['NAT'].replace(' ', '')) or ''
+
+            entry = re.sub(r'[^\w\s]', '', cells['ENTRY']).title()
+
+            lap_time = cells['TIME'].replace(' ', '')
+            if lap_time and not re.fullmatch(r'\d+:\d{2}\.\d{3}', lap_time):
+                raise ValueError(f"Unreadable lap time '{lap_time}'")
+
+            laps = re.sub(r'\D', '', cells['LAPS']) or None
+            on = re.sub(r'\D', '', cells['ON']) or None
+
+            parsed_rows.append({
+                'POS': pos,
+                'NO': no,
+                'NAME': name,
+                'NAT': nat,
+                'ENTRY': entry,
+                'TIME': lap_time or None,
+                'LAPS': laps,
+                'ON': on
+            })
+
+        except Exception as e:
+            print(f"Row skipped due to error: {e}\n{joined}")
+            bad_rows.append({
+                    'error': str(e),
+                    'raw_row': joined,
+                    'row_span': row['box']
+                })
+            continue
+
+    return pd.DataFrame(parsed_rows), bad_rows
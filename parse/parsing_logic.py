@@ -2,73 +2,31 @@ import re
 import os
 import pandas as pd
 
-from thefuzz import fuzz, process
 from collections import defaultdict
 
-# ~~~~ Defined Constants ~~~~~ #
-from parse.constants import MONTHS, NATIONALITIES
+# ~~~~ OCR-free parsing helpers ~~~~~ #
+from parse.parse_utils import parse_filename, extract_date, extract_circuit, parse_grid_to_dataframe
+from parse.ocr_correction import find_nationality, surname_index, correct_surname_tokens
 
 # ~~~~ Instantiated OCR models ~~~~~ #
-from parse.ocr_utils import ocr_standard, ocr_table, load_image, preprocess_image
+from parse.ocr_utils import ocr_standard, ocr_table, load_image, preprocess_image, ocr_table_grid,\
+    segment_table_grid, crop_row_strips, table_span_to_image
 
 # ~~~~ Metadata extraction ~~~~ #
 
-def parse_filename(fname):
-    '''Extract strings for year, session, and day, encoded in the file name in that order'''
-    base = os.path.splitext(os.path.basename(fname))[0]
-    parts = re.split(r"[_-]", base)
-    year, session, day = parts[0], parts[1] if len(parts)>1 else '', parts[2] if len(parts)>2 else ''
-    return year, session, day
-
 def extract_text(img_crop, ocr_engine):
     '''Extract OCR text from image using defined ocr_engine instance'''
 
     result = ocr_engine.ocr(img_crop)
     return [entry[1][0] for entry in result[0]]
 
-def extract_date(date_lines):
-    '''Return Date string e.g. '12 March 2014' from OCR text input
-    Uses fuzzy matching here to fix OCR error months'''
-
-    if not date_lines:
-        return None
-    
-    tokens = date_lines[0].strip().split()
-
-    if len(tokens) >= 4 and tokens[-3].isdigit(): # date line usually long, with date at end
-
-        if tokens[-2] not in MONTHS: # Slight OCR error - fuzzy match to fix
-            month = process.extract(tokens[-2], MONTHS, limit=1)[0][0]
-            return tokens[-3]+' '+month+' '+tokens[-1]
-        
-        else:
-            return " ".join(tokens[-3:])
-        
-    return None
-
-def extract_circuit(title_lines):
-    '''Extract Circuit string from title img ocr result text.
-    Circuit typically all caps and the only token that doesn't contain a digit
-    Also large text, OCR typically good here'''
-
-    if not title_lines:
-        return None
-    
-    parts = [p.strip() for p in title_lines[0].split('-')]
-
-    for part in parts:
-
-        if not re.search(r'\d', part): # Only the circuit should be digit free
-            return part[0].upper()+part[1:].lower()
-        
-    return None
-
 # ~~~~ Table OCR Processing ~~~~ #
 
-def ocr_results_to_rows(ocr_result, y_tolerance=10):
+def ocr_results_to_rows(ocr_result, y_tolerance=10, return_spans=False):
     """
     Group OCR output into rows by Y position.
     Returns a list of lists of strings (one list per row).
+    With return_spans=True, also returns the (y0, y1) extent of each row's boxes.
     """
     # box_list, text_list, _ = ocr_result[0]
     box_list = [entry[0] for entry in ocr_result[0]]
@@ -94,20 +52,28 @@ def ocr_results_to_rows(ocr_result, y_tolerance=10):
 
     # Sort rows (top to bottom), then sort entries within each row (left to right)
     sorted_rows = []
+    row_spans = []
     for key in sorted(rows):
         row = sorted(rows[key], key=lambda x: x[0][0][0])  # sort by x-position
         sorted_rows.append([text for _, text in row])
 
+        ys = [pt[1] for box, _ in row for pt in box]
+        row_spans.append((min(ys), max(ys)))
+
+    if return_spans:
+        return sorted_rows, row_spans
+
     return sorted_rows
 
-def parse_ocr_to_dataframe(ocr_result):
+def parse_ocr_to_dataframe(ocr_result, year=None):
     """
     Convert OCR output into a structured pandas DataFrame,
     handling optional CL and PL columns and skipping post-table notes.
+    Given the year, driver surnames are corrected against the drivers known for that season.
     """
-    rows = ocr_results_to_rows(ocr_result)
+    rows, row_spans = ocr_results_to_rows(ocr_result, return_spans=True)
     if not rows or len(rows) < 2:
-        return pd.DataFrame()
+        return pd.DataFrame(), []
 
     header_row = ' '.join(rows[0]).split()
     
@@ -116,13 +82,15 @@ def parse_ocr_to_dataframe(ocr_result):
     has_cl = 'CL' in header_row
     has_pl = 'PL' in header_row or 'PIC' in header_row
 
+    surnames = surname_index(int(year)) if year and str(year).isdigit() else None
+
     parsed_rows = []
     bad_rows = []
 
     if rows is None:
         raise ValueError("No rows detected from OCR parsing.")  
 
-    for row in rows[1:]:
+    for row, row_span in zip(rows[1:], row_spans[1:]):
         # Skip rows that are not data - usually infringements
         joined = ' '.join(row)
         if joined.strip().startswith('CAR') or not any(char.isdigit() for char in joined):
@@ -154,22 +122,18 @@ def parse_ocr_to_dataframe(ocr_result):
             if has_pl and tokens[start].isdigit():
                 start += 1
 
-            name_tokens = []
-                        
-            # Crawl through name until we find a known nationality code (even if OCR-mangled)
-            while start < len(tokens):
-                token = re.sub(r'[^A-Za-z]', '', tokens[start])  # remove dots/punctuation
-                token_upper = token.upper()
-                if token_upper in NATIONALITIES:
-                    nat = token_upper
-                    break
-                name_tokens.append(tokens[start])
-                start += 1
-            else:
+            # The name runs up to the nationality code (even if OCR-mangled)
+            nat_index, nat = find_nationality(tokens[start:], surnames)
+            if nat_index is None:
                 # fallback in case nothing matched
+                name_tokens = tokens[start:]
                 nat = ''
-                
-            name = ' '.join(name_tokens)
+                start = len(tokens)
+            else:
+                name_tokens = tokens[start:start + nat_index]
+                start += nat_index
+
+            name = ' '.join(correct_surname_tokens(name_tokens, year))
             name = re.sub(r'[^\w\s]', '', name)
             name = name.title()
                 
@@ -210,7 +174,8 @@ def parse_ocr_to_dataframe(ocr_result):
             print(f"Row skipped due to error: {e}\n{row}")
             bad_rows.append({
                     'error': str(e),
-                    'raw_row': ' '.join(row)
+                    'raw_row': ' '.join(row),
+                    'row_span': row_span
                 })
             continue
 
@@ -218,48 +183,166 @@ def parse_ocr_to_dataframe(ocr_result):
 
 # ~~~~ Returning Final DataFrame ~~~~ #
 
-def process_image_to_dataframe(image_path, ocr_engine = ocr_standard, table_ocr_engine=ocr_table):
+def sheet_metadata(image_path, date_lines, title_lines):
     """
-    Given an image path and cropped regions, performs OCR + parsing + metadata attachment.
-    Returns a DataFrame of parsed table rows with metadata columns included.
+    Combine the OCR text of the date and title crops with the file name metadata.
+    Returns a dictionary with keys ['DATE', 'CIRCUIT', 'YEAR', 'SESSION', 'DAY', 'FILENAME'].
     """
+    year, session, day = parse_filename(image_path)
 
-    # Load full image and crops
-    img = load_image(image_path)
-    cropped = preprocess_image(img)
+    return {
+        'DATE': extract_date(date_lines),
+        'CIRCUIT': extract_circuit(title_lines),
+        'YEAR': year,
+        'SESSION': session,
+        'DAY': day,
+        'FILENAME': os.path.basename(image_path)
+    }
+
+def extract_sheet_metadata(image_path, cropped, ocr_engine=ocr_standard):
+    """OCR the date and title crops of a sheet and return its metadata (see sheet_metadata)"""
+    date_lines = extract_text(cropped['date_img'], ocr_engine)
+    title_lines = extract_text(cropped['title_img'], ocr_engine)
+
+    return sheet_metadata(image_path, date_lines, title_lines)
+
+def load_sheet(image_path):
+    """Load a sheet and return its preprocessed crops (see preprocess_image)"""
+    return preprocess_image(load_image(image_path))
+
+def ocr_sheet(cropped, ocr_engine=ocr_standard, table_ocr_engine=ocr_table, grid=False, templates=None):
+    """
+    Run every OCR pass over the crops of a sheet - the only expensive step of processing it.
+    With grid=True the table is segmented into cells and only text recognition is run (ocr_table_grid),
+    reading numeric cells from glyph templates first if given.
+
+    Returns a dictionary with keys ['table' (raw table OCR result, or grid rows), 'grid',
+    'date_lines', 'title_lines', 'table_box'], to be parsed by parse_sheet.
+    """
     table_image = cropped['table_img']
-    date_image = cropped['date_img']
-    title_image = cropped['title_img']
 
-    # Perform OCR
-    table_ocr = table_ocr_engine.ocr(table_image)
-    date_lines = extract_text(date_image, ocr_engine)
-    title_lines = extract_text(title_image, ocr_engine)
+    if grid:
+        table = ocr_table_grid(table_image, table_ocr_engine, templates=templates)
+    else:
+        table = table_ocr_engine.ocr(table_image)
+
+    return {
+        'table': table,
+        'grid': grid,
+        'date_lines': extract_text(cropped['date_img'], ocr_engine),
+        'title_lines': extract_text(cropped['title_img'], ocr_engine),
+        'table_box': cropped['table_box'],
+    }
 
+def parse_sheet(image_path, sheet_ocr):
+    """
+    Parse the OCR output of a sheet (from ocr_sheet) into a DataFrame of table rows
+    with metadata columns attached, and the list of rows that failed to parse.
+    """
     # Extract metadata
-    date_str = extract_date(date_lines)
-    circuit_str = extract_circuit(title_lines)
-    year, session, day = parse_filename(image_path)
-
-    df, bad_rows = parse_ocr_to_dataframe(table_ocr)
+    metadata = sheet_metadata(image_path, sheet_ocr['date_lines'], sheet_ocr['title_lines'])
 
-    filename = os.path.basename(image_path)
+    if sheet_ocr['grid']:
+        df, bad_rows = parse_grid_to_dataframe(sheet_ocr['table'], year=metadata['YEAR'])
+    else:
+        df, bad_rows = parse_ocr_to_dataframe(sheet_ocr['table'], year=metadata['YEAR'])
 
-    # Attach filename to each bad row
+    # Attach filename, and the row's position in the full image (for retry_failed_rows), to each bad row
     for row in bad_rows:
-        row['FILENAME'] = filename
+        row['ROW_Y0'], row['ROW_Y1'] = table_span_to_image(row.pop('row_span'), sheet_ocr['table_box'])
+        row['FILENAME'] = metadata['FILENAME']
 
     # Attach metadata to parsed rows
-    metadata = {
-        'DATE': date_str,
-        'CIRCUIT': circuit_str,
-        'YEAR': year,
-        'SESSION': session,
-        'DAY': day,
-        'FILENAME': filename
-    }
-
     for key, value in metadata.items():
         df[key] = value
 
-    return df, bad_rows
\ No newline at end of file
+    return df, bad_rows
+
+def process_image_to_dataframe(image_path, ocr_engine = ocr_standard, table_ocr_engine=ocr_table, grid=False, templates=None):
+    """
+    Given an image path and cropped regions, performs OCR + parsing + metadata attachment.
+    With grid=True the table is segmented into cells and only text recognition is run (ocr_table_grid),
+    reading numeric cells from glyph templates first if given.
+    Returns a DataFrame of parsed table rows with metadata columns included.
+    """
+
+    # Load full image and crops
+    cropped = load_sheet(image_path)
+
+    # Perform OCR
+    sheet_ocr = ocr_sheet(cropped, ocr_engine, table_ocr_engine, grid=grid, templates=templates)
+
+    return parse_sheet(image_path, sheet_ocr)
+
+# ~~~~ Retrying Failed Rows ~~~~ #
+
+def failed_row_span(failed_row, data_rows, table_box):
+    """
+    Position (y0, y1) of a failed row in the full image. Uses the ROW_Y0/ROW_Y1 logged with it,
+    or for rows logged without them, the grid row (from segment_table_grid) at the row's leading POS.
+    Returns None if the row can't be located.
+    """
+    # Logs read as text have '' for rows without a position
+    y0 = pd.to_numeric(failed_row.get('ROW_Y0'), errors='coerce')
+    y1 = pd.to_numeric(failed_row.get('ROW_Y1'), errors='coerce')
+    if pd.notna(y0) and pd.notna(y1):
+        return int(y0), int(y1)
+
+    pos_match = re.match(r'\s*(\d{1,2})\b', str(failed_row.get('raw_row', '')))
+    if not pos_match or not 0 < int(pos_match.group(1)) <= len(data_rows):
+        return None
+
+    return table_span_to_image(data_rows[int(pos_match.group(1)) - 1], table_box)
+
+def retry_failed_rows(image_path, failed_rows, metadata, table_ocr_engines=(ocr_table,), scales=(3, 4)):
+    """
+    Re-OCR only the failed rows of a sheet, instead of the whole sheet.
+
+    Each row strip is cropped from the full image together with the table header (so
+    parse_ocr_to_dataframe can tell which optional columns are present), upscaled and re-parsed.
+    Attempts go through each engine (e.g. with alternative detection thresholds) at each scale,
+    stopping at the first that parses into a row.
+
+    Returns (DataFrame of recovered rows with metadata attached, list of rows still failing).
+    """
+    img = load_image(image_path)
+    cropped = preprocess_image(img, return_title=False)
+    table_box = cropped['table_box']
+
+    header_row, data_rows, _, _ = segment_table_grid(cropped['table_img'])
+    if header_row is None:
+        return pd.DataFrame(), list(failed_rows)
+
+    header_span = table_span_to_image(header_row, table_box)
+
+    recovered = []
+    still_bad = []
+
+    for failed_row in failed_rows:
+        row_span = failed_row_span(failed_row, data_rows, table_box)
+
+        parsed = None
+        if row_span is not None:
+            attempts = [(engine, scale) for engine in table_ocr_engines for scale in scales]
+            for engine, scale in attempts:
+                strip = crop_row_strips(img, table_box, [header_span, row_span], scale=scale)
+                ocr_result = engine.ocr(strip)
+                if not ocr_result or not ocr_result[0]:
+                    continue
+
+                df, _ = parse_ocr_to_dataframe(ocr_result, year=metadata.get('YEAR'))
+                if len(df) == 1:
+                    parsed = df.iloc[0].to_dict()
+                    break
+
+        if parsed is None:
+            still_bad.append(failed_row)
+        else:
+            recovered.append(parsed)
+
+    df = pd.DataFrame(recovered)
+    if not df.empty:
+        for key, value in metadata.items():
+            df[key] = value
+
+    return df, still_bad
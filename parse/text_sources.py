@@ -0,0 +1,184 @@
+import re
+import os
+
+from bs4 import BeautifulSoup
+
+# ~~~~ Defined Constants ~~~~~ #
+from parse.constants import MONTHS, TABLE_COLUMNS, TEXT_HEADER_ALIASES
+
+# ~~~~ OCR-free parsing helpers ~~~~~ #
+from parse.parse_utils import parse_filename, parse_grid_to_dataframe
+
+# Classification pages for 2019+ sessions (F1 site articles, wiki tables) saved locally as
+# .html or .txt - parsed straight into labelled rows, without loading any OCR engine.
+
+HTML_EXTENSIONS = {'.html', '.htm'}
+
+MONTH_PATTERN = '|'.join(sorted(MONTHS))
+
+# ~~~~ Cell cleanup ~~~~ #
+
+def label_header(cells):
+    '''Map header cell texts to TABLE_COLUMNS labels (None for columns we don't keep)'''
+    labels = []
+    for cell in cells:
+        key = re.sub(r'[.:]', '', cell).strip().lower()
+        key = re.sub(r'\s+', ' ', key)
+        labels.append(TEXT_HEADER_ALIASES.get(key))
+    return labels
+
+def normalize_lap_time(text):
+    '''
+    Return a lap time as 'm:ss.sss', the format of the timing sheets.
+    Accepts '1:16.231', '1m16.231s' and plain seconds '76.231'. Returns '' for no time.
+    '''
+    text = text.strip().replace(' ', '')
+
+    match = re.fullmatch(r"(\d+)[:m](\d{1,2})\.(\d{3})s?", text)
+    if match:
+        return f"{int(match.group(1))}:{int(match.group(2)):02d}.{match.group(3)}"
+
+    match = re.fullmatch(r"(\d+)\.(\d{3})s?", text)
+    if match:
+        minutes, seconds = divmod(int(match.group(1)), 60)
+        return f"{minutes}:{seconds:02d}.{match.group(2)}"
+
+    # 'No time', '-', gaps like '+0.412s' - keep anything with a digit so the row is flagged
+    return text if re.search(r'\d', text) and not text.startswith('+') else ''
+
+def clean_driver_name(text):
+    '''Drop the three letter abbreviation the F1 site appends to names, e.g. 'Charles Leclerc LEC' '''
+    tokens = text.split()
+    if len(tokens) > 2 and re.fullmatch(r'[A-Z]{3}', tokens[-1]) and not tokens[-2].isupper():
+        tokens = tokens[:-1]
+    return ' '.join(tokens)
+
+def to_labelled_row(labels, cells):
+    '''Build a row in the ocr_table_grid format, so it goes through parse_grid_to_dataframe'''
+    cells_by_label = {label: '' for label in TABLE_COLUMNS}
+    for label, text in zip(labels, cells):
+        if label in cells_by_label and not cells_by_label[label]:
+            cells_by_label[label] = text.strip()
+
+    cells_by_label['NAME'] = clean_driver_name(cells_by_label['NAME'])
+    cells_by_label['ENTRY'] = cells_by_label['ENTRY'].replace('-', ' ') # 'Red Bull Racing-Honda'
+    cells_by_label['TIME'] = normalize_lap_time(cells_by_label['TIME'])
+
+    return {
+        'cells': cells_by_label,
+        'raw_row': ' '.join(cell.strip() for cell in cells if cell.strip()),
+        'box': None,
+    }
+
+# ~~~~ Table extraction ~~~~ #
+
+def _is_classification(labels):
+    return 'NAME' in labels and ('TIME' in labels or 'LAPS' in labels)
+
+def rows_from_html(html):
+    '''
+    Find the classification table in an HTML page (the table with the most rows among those
+    whose header has a driver column and a time or laps column) and return its labelled rows.
+    '''
+    soup = BeautifulSoup(html, 'html.parser')
+
+    best = []
+    for table in soup.find_all('table'):
+        rows = [
+            [cell.get_text(' ', strip=True) for cell in tr.find_all(['th', 'td'])]
+            for tr in table.find_all('tr')
+        ]
+        rows = [row for row in rows if any(row)]
+        if len(rows) < 2:
+            continue
+
+        labels = label_header(rows[0])
+        if not _is_classification(labels):
+            continue
+
+        labelled = [to_labelled_row(labels, row) for row in rows[1:]]
+        if len(labelled) > len(best):
+            best = labelled
+
+    return best
+
+def split_text_line(line):
+    '''Split a line of a plain text table on tabs, '|' or runs of 2+ spaces'''
+    return [cell.strip() for cell in re.split(r'\t|\||\s{2,}', line.strip()) if cell.strip()]
+
+def rows_from_text(text):
+    '''
+    Find a classification table in plain text (e.g. a table copied from a page): the first line whose
+    fields label as a classification header, then every following line with the same number of fields.
+    '''
+    lines = text.splitlines()
+
+    for i, line in enumerate(lines):
+        labels = label_header(split_text_line(line))
+        if not _is_classification(labels):
+            continue
+
+        rows = []
+        for data_line in lines[i + 1:]:
+            cells = split_text_line(data_line)
+            if len(cells) == len(labels):
+                rows.append(to_labelled_row(labels, cells))
+        return rows
+
+    return []
+
+def extract_text_date(text):
+    '''Return the first date in the text as e.g. '26 February 2019', accepting '26th February 2019' and 'February 26, 2019' '''
+    match = re.search(rf"\b(\d{{1,2}})(?:st|nd|rd|th)?\s+({MONTH_PATTERN})\s+(\d{{4}})\b", text)
+    if match:
+        return f"{int(match.group(1))} {match.group(2)} {match.group(3)}"
+
+    match = re.search(rf"\b({MONTH_PATTERN})\s+(\d{{1,2}})(?:st|nd|rd|th)?,?\s+(\d{{4}})\b", text)
+    if match:
+        return f"{int(match.group(2))} {match.group(1)} {match.group(3)}"
+
+    return None
+
+# ~~~~ Returning Final DataFrame ~~~~ #
+
+def parse_text_source(path, date=None, circuit=None):
+    """
+    Parse a saved HTML or plain text classification page into the same DataFrame as
+    process_image_to_dataframe: POS, NO, NAME, NAT, ENTRY, TIME, LAPS, ON plus metadata columns.
+
+    The year, session and day come from the file name (see parse_filename). date and circuit can be
+    given - e.g. from a metadata file - else the date is the first one found in the page.
+    Returns (DataFrame, bad_rows).
+    """
+    with open(path, encoding='utf-8') as f:
+        content = f.read()
+
+    if os.path.splitext(path)[1].lower() in HTML_EXTENSIONS:
+        rows = rows_from_html(content)
+        page_text = BeautifulSoup(content, 'html.parser').get_text(' ')
+    else:
+        rows = rows_from_text(content)
+        page_text = content
+
+    df, bad_rows = parse_grid_to_dataframe(rows)
+
+    year, session, day = parse_filename(path)
+    filename = os.path.basename(path)
+
+    for row in bad_rows:
+        row.pop('row_span', None)
+        row['FILENAME'] = filename
+
+    metadata = {
+        'DATE': date or extract_text_date(page_text),
+        'CIRCUIT': circuit,
+        'YEAR': year,
+        'SESSION': session,
+        'DAY': day,
+        'FILENAME': filename
+    }
+
+    for key, value in metadata.items():
+        df[key] = value
+
+    return df, bad_rows
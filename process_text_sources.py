@@ -0,0 +1,72 @@
+import os
+import pandas as pd
+
+from parse.text_sources import parse_text_source, HTML_EXTENSIONS
+
+
+INPUT_DIR = "./data/input_text"
+METADATA_CSV = "./data/input_text/metadata.csv" # Optional: FILENAME, DATE, CIRCUIT per page
+OUTPUT_CSV = "./output/parsed_results.csv"
+TEXT_FAIL_LOG = "./output/text_failed_rows.csv"
+
+TEXT_EXTENSIONS = HTML_EXTENSIONS | {'.txt'}
+
+if __name__ == "__main__":
+    # 2019+ sessions from saved classification pages - no OCR engine is loaded
+    if os.path.exists(OUTPUT_CSV):
+        output_columns = pd.read_csv(OUTPUT_CSV, nrows=0).columns
+        processed = set(pd.read_csv(OUTPUT_CSV, usecols=['FILENAME'])['FILENAME'].unique())
+    else:
+        output_columns = None
+        processed = set()
+
+    page_metadata = {}
+    if os.path.exists(METADATA_CSV):
+        df_meta = pd.read_csv(METADATA_CSV, dtype=str).fillna('').set_index('FILENAME')
+        page_metadata = df_meta.to_dict('index')
+
+    # Not shipped with the repo - created on first run, for the pages to be saved into
+    os.makedirs(INPUT_DIR, exist_ok=True)
+
+    file_list = sorted(
+        f for f in os.listdir(INPUT_DIR)
+        if os.path.splitext(f)[1].lower() in TEXT_EXTENSIONS and f not in processed
+    )
+    print(f"Found {len(file_list)} unprocessed text sources.\n")
+
+    parsed = []
+    bad_log = []
+
+    for i, fname in enumerate(file_list, 1):
+        print(f"[{i}] Processing {fname}")
+        meta = page_metadata.get(fname, {})
+
+        try:
+            df, bad_rows = parse_text_source(
+                os.path.join(INPUT_DIR, fname),
+                date=meta.get('DATE') or None,
+                circuit=meta.get('CIRCUIT') or None
+            )
+        except Exception as e:
+            print(f"⚠️ Failed to process {fname}: {e}")
+            continue
+
+        if df.empty:
+            print(f"⚠️ No classification table found in {fname}")
+            continue
+
+        parsed.append(df)
+        bad_log.extend(bad_rows)
+
+    if parsed:
+        combined = pd.concat(parsed, ignore_index=True)
+        if output_columns is not None:
+            combined = combined.reindex(columns=output_columns)
+        combined.to_csv(OUTPUT_CSV, mode='a', index=False, header=output_columns is None)
+        print(f"✔ Saved {len(parsed)} entries to {OUTPUT_CSV}")
+
+    if bad_log:
+        error_df = pd.DataFrame(bad_log)
+        if os.path.exists(TEXT_FAIL_LOG):
+            error_df = pd.concat([pd.read_csv(TEXT_FAIL_LOG), error_df], ignore_index=True)
+        error_df.to_csv(TEXT_FAIL_LOG, index=False)
@@ -1,4 +1,8 @@
 
+import os
+import json
+import hashlib
+
 import numpy as np
 import pandas as pd
 from rapidfuzz import process, fuzz
@@ -24,8 +28,28 @@ COLUMN_MAPPING = {
     'ON': 'lap_number_fastest'
 }
 
-def load_and_standardize_raw_data(filepath: str) -> pd.DataFrame:
-    '''Loads raw, unprocessed timing sheet data excel at filepath and renames available columns to match Schema'''
+# Bump whenever _read_and_standardize_excel changes how values are coerced - invalidates the Parquet mirrors
+CACHE_VERSION = 1
+
+def _cache_schema() -> dict:
+    '''Everything the Parquet mirror depends on besides the workbook itself'''
+    return {'version': CACHE_VERSION, 'import': COLUMNS_TO_IMPORT, 'columns': COLUMN_MAPPING}
+
+def _file_sha256(filepath: str, chunk_size: int = 1 << 20) -> str:
+    '''Return the sha256 hex digest of the file at filepath, read in chunks'''
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _cache_paths(filepath: str) -> tuple[str, str]:
+    '''Parquet mirror and its metadata sidecar, stored next to the workbook'''
+    base = os.path.splitext(filepath)[0]
+    return base + '.parquet', base + '.parquet.json'
+
+def _read_and_standardize_excel(filepath: str) -> pd.DataFrame:
+    '''Slow path: parse the workbook and apply the column renames and dtype coercions'''
 
     df = pd.read_excel(filepath, usecols=COLUMNS_TO_IMPORT)
     df.rename(columns = COLUMN_MAPPING, inplace=True)
@@ -34,6 +58,46 @@ def load_and_standardize_raw_data(filepath: str) -> pd.DataFrame:
 
     return df
 
+def load_and_standardize_raw_data(filepath: str, use_cache: bool = True) -> pd.DataFrame:
+    '''
+    Loads raw, unprocessed timing sheet data excel at filepath and renames available columns to match Schema
+
+    Keeps a standardized Parquet mirror of the workbook next to it. The mirror is reused while the
+    workbook's mtime is unchanged, or its sha256 still matches (e.g. file touched or copied), else rebuilt.
+    It is also rebuilt when the imported columns, renames or CACHE_VERSION change.
+    '''
+    if not use_cache:
+        return _read_and_standardize_excel(filepath)
+
+    cache_path, meta_path = _cache_paths(filepath)
+    mtime = os.stat(filepath).st_mtime_ns
+
+    meta = None
+    if os.path.exists(cache_path) and os.path.exists(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+
+    if meta is not None and meta.get('schema') == _cache_schema():
+        if meta.get('mtime') == mtime:
+            return pd.read_parquet(cache_path)
+
+        sha = _file_sha256(filepath)
+        if meta.get('sha256') == sha: # Content unchanged, only refresh the stored mtime
+            meta['mtime'] = mtime
+            with open(meta_path, 'w') as f:
+                json.dump(meta, f)
+            return pd.read_parquet(cache_path)
+    else:
+        sha = _file_sha256(filepath)
+
+    df = _read_and_standardize_excel(filepath)
+    df.to_parquet(cache_path, index=False)
+
+    with open(meta_path, 'w') as f:
+        json.dump({'mtime': mtime, 'sha256': sha, 'schema': _cache_schema()}, f)
+
+    return df
+
 def add_test_type(df: pd.DataFrame) -> pd.DataFrame:
     '''
     Add's a 'test_type' column to dataframe, based on the month of the test 'date'
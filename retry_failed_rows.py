@@ -0,0 +1,84 @@
+import os
+import pandas as pd
+
+from paddleocr import PaddleOCR
+
+from parse.parsing_logic import retry_failed_rows, extract_sheet_metadata
+from parse.ocr_utils import ocr_table, load_image, preprocess_image
+
+
+INPUT_DIR = "./data/input_gifs"
+OUTPUT_CSV = "./output/parsed_results.csv"
+OCR_FAIL_LOG = "./output/ocr_failed_rows.csv"
+
+METADATA_COLUMNS = ['DATE', 'CIRCUIT', 'YEAR', 'SESSION', 'DAY', 'FILENAME']
+
+# Second attempt engine: looser detection, so faint or tightly spaced tokens are kept
+ocr_retry = PaddleOCR(
+    use_angle_cls=True,
+    lang='en',
+    det_db_thresh=0.2,
+    det_db_box_thresh=0.2,
+    det_db_unclip_ratio=1.6
+)
+
+def merge_recovered(df_master, df_recovered):
+    '''
+    Insert recovered rows into the master results, keeping each sheet's rows
+    together (in existing sheet order) and ordered by POS within the sheet.
+    '''
+    df_merged = pd.concat([df_master, df_recovered], ignore_index=True)
+
+    file_order = {fname: i for i, fname in enumerate(pd.unique(df_merged['FILENAME']))}
+    sort_keys = pd.DataFrame({
+        'file': df_merged['FILENAME'].map(file_order),
+        'pos': pd.to_numeric(df_merged['POS'], errors='coerce'),
+    })
+    order = sort_keys.sort_values(['file', 'pos'], kind='stable').index
+
+    return df_merged.loc[order].reset_index(drop=True)
+
+if __name__ == "__main__":
+    # Only the failed rows are re-OCRed - cost scales with the number of bad rows, not sheets
+    # Read as text - the results file is written back whole, and untouched rows must stay exactly as saved
+    df_failed = pd.read_csv(OCR_FAIL_LOG, dtype=str, keep_default_na=False)
+    df_master = pd.read_csv(OUTPUT_CSV, dtype=str, keep_default_na=False) if os.path.exists(OUTPUT_CSV) else pd.DataFrame(columns=METADATA_COLUMNS)
+
+    recovered = []
+    still_bad = []
+
+    for i, (fname, group) in enumerate(df_failed.groupby('FILENAME', sort=False), 1):
+        path = os.path.join(INPUT_DIR, fname)
+        failed_rows = group.to_dict('records')
+
+        if not os.path.exists(path):
+            still_bad.extend(failed_rows)
+            continue
+
+        print(f"[{i}] Retrying {len(failed_rows)} rows of {fname}")
+
+        # Reuse the sheet's metadata from its parsed rows, else OCR it from the date/title crops
+        sheet_rows = df_master[df_master['FILENAME'] == fname]
+        if not sheet_rows.empty:
+            metadata = sheet_rows.iloc[0][METADATA_COLUMNS].to_dict()
+        else:
+            metadata = extract_sheet_metadata(path, preprocess_image(load_image(path)))
+
+        df_recovered, bad_rows = retry_failed_rows(
+            image_path=path,
+            failed_rows=failed_rows,
+            metadata=metadata,
+            table_ocr_engines=(ocr_table, ocr_retry)
+        )
+
+        recovered.append(df_recovered)
+        still_bad.extend(bad_rows)
+
+    recovered = [df for df in recovered if not df.empty]
+    if recovered:
+        df_master = merge_recovered(df_master, pd.concat(recovered, ignore_index=True))
+        df_master.to_csv(OUTPUT_CSV, index=False)
+
+    pd.DataFrame(still_bad, columns=df_failed.columns).to_csv(OCR_FAIL_LOG, index=False)
+
+    print(f"✔ Recovered {len(df_failed) - len(still_bad)} of {len(df_failed)} failed rows into {OUTPUT_CSV}")
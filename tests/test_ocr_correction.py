@@ -0,0 +1,85 @@
+import os
+import pytest
+
+from parse.ocr_correction import NATIONALITY_INDEX, MONTH_INDEX, surname_index, correct_surname_tokens, find_nationality
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEADER = 'POS NO NAME NAT ENTRANT TIME ON LAPS'
+
+
+@pytest.fixture(autouse=True)
+def repo_root(monkeypatch):
+    # The F1DB files are read relative to the working directory
+    monkeypatch.chdir(REPO_ROOT)
+
+
+def to_ocr_result(lines):
+    '''Lay text lines out as PaddleOCR output, one box per line'''
+    return [[
+        [[[0, 40*i], [10, 40*i], [10, 40*i + 10], [0, 40*i + 10]], (line, 0.9)]
+        for i, line in enumerate(lines)
+    ]]
+
+
+def parse_row(raw_row, year):
+    parsing_logic = pytest.importorskip('parse.parsing_logic')
+    df, bad_rows = parsing_logic.parse_ocr_to_dataframe(to_ocr_result([HEADER, raw_row]), year=year)
+    return (df.iloc[0].to_dict() if len(df) else None), bad_rows
+
+
+@pytest.mark.parametrize('token, expected', [
+    ('GER', ('GER', 0)), ('6BR', ('GBR', 0)), ('FlN', ('FIN', 0)), ('NLO', ('NLD', 1)),
+    ('ESF', (None, None)), # ESP and EST equally close
+])
+def test_nationality_lookup(token, expected):
+    assert NATIONALITY_INDEX.lookup(token) == expected
+
+
+def test_month_lookup():
+    assert MONTH_INDEX.correct('Marcn') == 'March'
+    assert MONTH_INDEX.correct('0ctober') == 'October'
+    assert MONTH_INDEX.correct('Xyzzy') is None
+
+
+@pytest.mark.parametrize('tokens, expected', [
+    (['BUM', 'SUI', 'Scuderia'], (1, 'SUI')),
+    (['QING', 'HUA', 'CHI', 'Hrt'], (2, 'CHI')),
+    (['HAMILTON', 'GBRMercedes', 'AMG', 'Petronas'], (None, None)),
+    (['VAN', 'DER', 'GARDE', 'NLO', 'Caterham'], (3, 'NLD')),
+])
+def test_find_nationality(tokens, expected):
+    assert find_nationality(tokens, surname_index(2012)) == expected
+
+
+@pytest.mark.parametrize('year, tokens, expected', [
+    (2011, ['Paul', 'DIRESTA'], ['Paul', 'DI RESTA']),
+    (2011, ['Paul', 'DI', 'RESTA'], ['Paul', 'DI RESTA']),
+    (2010, ['Lucas', 'DIGRASSI'], ['Lucas', 'DI GRASSI']),
+    (2010, ['Lucas', 'DGRASSI'], ['Lucas', 'DGRASSI']), # DI GRASSI and GRASSI equally close
+    (2008, ['Pedro', 'DE', 'LAROSA'], ['Pedro', 'DE LA ROSA']),
+    (2008, ['Pedro', 'LAROSA'], ['Pedro', 'LA ROSA']),
+    (2008, ['Femando', 'AL0NSO'], ['Femando', 'ALONSO']),
+    (2013, ['Valtteri', 'BOTTA', 'S'], ['Valtteri', 'BOTTAS']),
+    (2012, ['Davide', 'VAL', 'SECCHI'], ['Davide', 'VALSECCHI']),
+])
+def test_correct_surname_tokens(year, tokens, expected):
+    assert correct_surname_tokens(tokens, year) == expected
+
+
+@pytest.mark.parametrize('raw_row, year, name, nat, entry', [
+    ('3 37 Sebastien BUM SUI Scuderia Toro Rosso 1:20.209 60 88', '2009', 'Sebastien Bum', 'SUI', 'Scuderia Toro Rosso'),
+    ('4 41 Ma QING HUA CHI Hrt F1 Team 1:37.829 68 32', '2012', 'Ma Qing Hua', 'CHI', 'Hrt F1 Team'),
+    ('2 27 Nico HULKENBER6 6ER Sahara Force India 1:23.000 12 50', '2014', 'Nico Hulkenberg', 'GER', 'Sahara Force India'),
+    ('4 22 Giedo VAN DER GARDE NLO Caterham F1 Team 1:24.100 20 60', '2013', 'Giedo Van Der Garde', 'NLD', 'Caterham F1 Team'),
+])
+def test_parse_row_nationality(raw_row, year, name, nat, entry):
+    row, _ = parse_row(raw_row, year)
+    assert (row['NAME'], row['NAT'], row['ENTRY']) == (name, nat, entry)
+
+
+def test_parse_row_without_code_still_fails():
+    # No code on the row - logged as a failure, not saved with an entrant word read as the code
+    row, bad_rows = parse_row('11 44 Lewis HAMILTON GBRMercedes AMG Petronas Formula One Team 1:30.425 39 120', '2018')
+    assert row is None
+    assert len(bad_rows) == 1